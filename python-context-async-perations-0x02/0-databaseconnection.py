@@ -1,15 +1,165 @@
+import os
+import time
 import sqlite3
+import threading
+
+DB_PATH = "users.db"
+POOL_SIZE = 5
+
+class ConnectionPool:
+    # Idle connections are reused newest-first; at most max_size are open
+    def __init__(self, database=DB_PATH, max_size=POOL_SIZE, timeout=5.0):
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._idle = []
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self.created = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.commits = 0
+        self.rollbacks = 0
+        self.discarded = 0
+
+    def connect(self):
+        conn = sqlite3.connect(self.database, timeout=self.timeout,
+                               check_same_thread=False)
+        self.created += 1
+        return conn
+
+    def acquire(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        with self._cond:
+            start = time.monotonic()
+            while True:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                if self._idle:
+                    self.checkouts += 1
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    self.checkouts += 1
+                    break
+                self.waits += 1
+                before = time.monotonic()
+                waited = self._cond.wait(timeout - (before - start))
+                self.wait_seconds += time.monotonic() - before
+                if not waited:
+                    raise TimeoutError(
+                        f"No connection to {self.database} within {timeout}s")
+        try:
+            return self.connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn, commit=True):
+        # Ends whatever transaction the caller left open, then parks it
+        try:
+            if conn.in_transaction:
+                if commit:
+                    conn.commit()
+                    self.commits += 1
+                else:
+                    conn.rollback()
+                    self.rollbacks += 1
+        except sqlite3.Error:
+            if conn.in_transaction:
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    pass
+            self.discard(conn)
+            raise
+        with self._cond:
+            if self._closed:
+                conn.close()
+                self._size -= 1
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self.discarded += 1
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for conn in self._idle:
+                conn.close()
+                self._size -= 1
+            self._idle.clear()
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_size": self.max_size,
+                "open": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "created": self.created,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 6),
+                "commits": self.commits,
+                "rollbacks": self.rollbacks,
+                "discarded": self.discarded,
+            }
+
+pools = {}
+pools_lock = threading.Lock()
+
+def get_pool(database=DB_PATH, **options):
+    # One pool per database file per process; options only size a new pool.
+    # A forked child never reuses its parent's connections.
+    path = os.path.abspath(database)
+    pool = pools.get(path)
+    if pool is None or pool.pid != os.getpid():
+        with pools_lock:
+            pool = pools.get(path)
+            if pool is None or pool.pid != os.getpid():
+                pool = pools[path] = ConnectionPool(path, **options)
+    return pool
+
+def close_pools():
+    with pools_lock:
+        for pool in pools.values():
+            pool.close()
+        pools.clear()
 
 class DatabaseConnection:
-    def __init__(self):  #
+    def __init__(self, database=DB_PATH):  #
         self.conn = None
+        self.pool = get_pool(database)
 
     def __enter__(self):
-        self.conn = sqlite3.connect("users.db")
+        self.conn = self.pool.acquire()
         return self.conn
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.conn.close()
+        conn, self.conn = self.conn, None
+        if exc_type is not None and issubclass(exc_type, sqlite3.DatabaseError) \
+                and not issubclass(exc_type, sqlite3.IntegrityError):
+            # The connection itself may be what failed; closing it rolls
+            # back whatever it had open, and nobody else gets it
+            self.pool.discard(conn)
+            return
+        self.pool.release(conn, commit=exc_type is None)
 
 # Required usage
 if __name__ == "__main__":
@@ -1,18 +1,66 @@
-import sqlite3
+import sys
+from collections import namedtuple
+
+DatabaseConnection = __import__('0-databaseconnection').DatabaseConnection
+
+def tuple_rows(columns):
+    return None
+
+def dict_rows(columns):
+    return lambda row: dict(zip(columns, row))
+
+def namedtuple_rows(columns):
+    # Built once per query; instances are tuples with no per-row dict
+    return namedtuple('Row', columns, rename=True)._make
+
+ROW_FORMATS = {
+    'tuple': tuple_rows,
+    'dict': dict_rows,
+    'namedtuple': namedtuple_rows,
+}
 
 class ExecuteQuery:
-    def __init__(self, query, params=()):
+    def __init__(self, query, params=(), stream=False, chunk_size=1000,
+                 rows='tuple'):
+        if rows not in ROW_FORMATS:
+            raise ValueError(f"rows must be one of {sorted(ROW_FORMATS)}")
         self.query = query
         self.params = params
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.rows = rows
+        self.connection = DatabaseConnection()
 
     def __enter__(self):
-        self.conn = sqlite3.connect("users.db")
-        self.cursor = self.conn.cursor()
-        self.cursor.execute(self.query, self.params)
-        return self.cursor.fetchall()
+        self.conn = self.connection.__enter__()
+        try:
+            self.cursor = self.conn.cursor()
+            self.cursor.execute(self.query, self.params)
+        except BaseException:
+            self.connection.__exit__(*sys.exc_info())
+            raise
+        columns = [column[0] for column in self.cursor.description or ()]
+        self.make_row = ROW_FORMATS[self.rows](columns)
+        if self.stream:
+            return self.iter_rows()
+        rows = self.cursor.fetchall()
+        return rows if self.make_row is None else [self.make_row(r) for r in rows]
+
+    def iter_rows(self):
+        # Only one chunk is held at a time; rows left unread when the block
+        # exits are never fetched
+        while True:
+            chunk = self.cursor.fetchmany(self.chunk_size)
+            if not chunk:
+                return
+            if self.make_row is None:
+                yield from chunk
+            else:
+                yield from map(self.make_row, chunk)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.conn.close()
+        self.cursor.close()
+        return self.connection.__exit__(exc_type, exc_val, exc_tb)
 
 # Usage
 if __name__ == "__main__":
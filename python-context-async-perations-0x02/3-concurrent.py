@@ -1,21 +1,26 @@
 import asyncio
-import aiosqlite
 
-async def async_fetch_users():
-    async with aiosqlite.connect("users.db") as db:
-        async with db.execute("SELECT * FROM users") as cursor:
-            return await cursor.fetchall()
+AsyncQueryExecutor = __import__('4-async_executor').AsyncQueryExecutor
 
-async def async_fetch_older_users():
-    async with aiosqlite.connect("users.db") as db:
-        async with db.execute("SELECT * FROM users WHERE age > 40") as cursor:
-            return await cursor.fetchall()
+async def async_fetch_users(db=None):
+    if db is None:
+        async with AsyncQueryExecutor() as db:
+            return await async_fetch_users(db)
+    return await db.fetch("users")
+
+async def async_fetch_older_users(db=None):
+    if db is None:
+        async with AsyncQueryExecutor() as db:
+            return await async_fetch_older_users(db)
+    return await db.fetch("users", where=("age", ">", 40))
 
 async def fetch_concurrently():
-    users, older_users = await asyncio.gather(
-        async_fetch_users(),
-        async_fetch_older_users()
-    )
+    # Both reads land in the same tick: one scan, the subset derived from it
+    async with AsyncQueryExecutor() as db:
+        users, older_users = await asyncio.gather(
+            async_fetch_users(db),
+            async_fetch_older_users(db)
+        )
     print("All Users:", users)
     print("Users older than 40:", older_users)
 
@@ -0,0 +1,165 @@
+import re
+import asyncio
+import operator
+import aiosqlite
+
+DB_PATH = "users.db"
+IDENTIFIER = re.compile(r"^[A-Za-z_]\w*$")
+OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+def check_identifier(name):
+    if not IDENTIFIER.match(name):
+        raise ValueError(f"Invalid identifier: {name!r}")
+    return name
+
+def read_query(table, where=None):
+    sql = f'SELECT * FROM "{check_identifier(table)}"'
+    if where is None:
+        return sql, ()
+    column, op, value = where
+    if op not in OPERATORS:
+        raise ValueError(f"Unsupported operator: {op!r}")
+    return f'{sql} WHERE "{check_identifier(column)}" {op} ?', (value,)
+
+def derive(rows, columns, where):
+    # SQL drops rows whose column is NULL; a TypeError from mixed types
+    # means SQLite's own comparison rules apply and the caller re-queries
+    column, op, value = where
+    index = columns.index(column)
+    compare = OPERATORS[op]
+    return [row for row in rows
+            if row[index] is not None and compare(row[index], value)]
+
+class AsyncQueryExecutor:
+    # Reads submitted in the same event-loop tick are planned together:
+    # identical queries run once, and filtered reads of a table that is
+    # also being scanned in full are answered from the scan's rows.
+    def __init__(self, database=DB_PATH, pool_size=2):
+        self.database = database
+        self.pool_size = pool_size
+        self._idle = asyncio.Queue()
+        self._connections = []
+        self._size = 0
+        self._pending = []
+        self._tasks = set()
+        self.requests = 0
+        self.queries = 0
+        self.merged = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        # aiosqlite connections run on non-daemon threads; close them all
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        connections, self._connections = self._connections, []
+        self._size = 0
+        self._idle = asyncio.Queue()
+        for conn in connections:
+            await conn.close()
+
+    async def _acquire(self):
+        # The slot is taken before connecting, which yields to other tasks
+        if self._idle.empty() and self._size < self.pool_size:
+            self._size += 1
+            try:
+                conn = await aiosqlite.connect(self.database)
+            except BaseException:
+                self._size -= 1
+                raise
+            self._connections.append(conn)
+            return conn
+        return await self._idle.get()
+
+    def fetch(self, table, where=None):
+        # where: (column, op, value), e.g. ("age", ">", 40)
+        read_query(table, where)
+        return self._submit(("table", table), where)
+
+    def execute(self, sql, params=()):
+        return self._submit(("sql", sql, tuple(params)), None)
+
+    def _submit(self, key, where):
+        # Hashed now, so an unhashable parameter fails its own caller
+        # instead of the flush that serves the whole tick
+        hash((key, where))
+        loop = asyncio.get_running_loop()
+        if not self._pending:
+            loop.call_soon(self._flush)
+        future = loop.create_future()
+        self._pending.append((key, where, future))
+        self.requests += 1
+        return future
+
+    def _flush(self):
+        pending, self._pending = self._pending, []
+        try:
+            self._plan(pending)
+        except Exception as e:
+            # Nothing submitted in this tick may be left waiting
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _plan(self, pending):
+        groups = {}
+        for key, where, future in pending:
+            groups.setdefault(key, []).append((where, future))
+        for key, reads in groups.items():
+            if key[0] == "sql":
+                self._start(key[1], key[2], [(None, future) for _, future in reads])
+            elif any(where is None for where, _ in reads):
+                self._start(*read_query(key[1]), reads, key[1])
+            else:
+                by_filter = {}
+                for where, future in reads:
+                    by_filter.setdefault(where, []).append((None, future))
+                for where, consumers in by_filter.items():
+                    self._start(*read_query(key[1], where), consumers)
+
+    def _start(self, sql, params, consumers, table=None):
+        self.queries += 1
+        self.merged += len(consumers) - 1
+        task = asyncio.ensure_future(self._run(sql, params, consumers, table))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, sql, params, consumers, table=None):
+        try:
+            conn = await self._acquire()
+            try:
+                async with conn.execute(sql, params) as cursor:
+                    rows = await cursor.fetchall()
+                    columns = [column[0] for column in cursor.description]
+            finally:
+                self._idle.put_nowait(conn)
+        except Exception as e:
+            for _, future in consumers:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        shared = False
+        for where, future in consumers:
+            if future.done():
+                continue
+            if where is None:
+                # Each caller gets its own list over the shared rows
+                future.set_result(list(rows) if shared else rows)
+                shared = True
+                continue
+            try:
+                future.set_result(derive(rows, columns, where))
+            except (TypeError, ValueError):
+                self.merged -= 1
+                self._start(*read_query(table, where), [(None, future)])
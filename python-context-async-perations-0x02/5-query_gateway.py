@@ -0,0 +1,190 @@
+import heapq
+import asyncio
+import itertools
+import aiosqlite
+
+DB_PATH = "users.db"
+
+class GatewayFull(Exception):
+    pass
+
+class AsyncDatabaseConnection:
+    # DatabaseConnection for coroutines: waits its turn at the gateway,
+    # lends out one of its connections and hands it back on exit
+    def __init__(self, gateway, priority=0, caller=None):
+        self.gateway = gateway
+        self.priority = priority
+        self.caller = caller
+        self.conn = None
+
+    async def __aenter__(self):
+        self.conn = await self.gateway.acquire(self.priority, self.caller)
+        return self.conn
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        conn, self.conn = self.conn, None
+        if exc_type is not None and issubclass(exc_type, asyncio.CancelledError):
+            # Stop the statement still running on the connection's thread
+            await conn.interrupt()
+            self.gateway.interrupted += 1
+        await self.gateway.release(conn, commit=exc_type is None)
+
+class QueryGateway:
+    # At most max_connections queries run at once; the rest wait in a
+    # queue ordered by priority (lower first), then by start-time fair
+    # queuing across callers, so one caller fanning out thousands of
+    # queries can't starve another. This is the semaphore, with an order.
+    def __init__(self, database=DB_PATH, max_connections=4, max_queue=None):
+        self.database = database
+        self.max_connections = max_connections
+        self.max_queue = max_queue
+        self._idle = []
+        self._busy = 0
+        self._queue = []
+        self._seq = itertools.count()
+        self._virtual = 0
+        self._finish = {}
+        self._waiting = 0
+        self._closed = False
+        self.opened = 0
+        self.max_queue_depth = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.interrupted = 0
+        self.rejected = 0
+        self.granted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def connection(self, priority=0, caller=None):
+        return AsyncDatabaseConnection(self, priority, caller)
+
+    async def fetch(self, sql, params=(), priority=0, caller=None):
+        async with self.connection(priority, caller) as conn:
+            cursor = await conn.execute(sql, params)
+            try:
+                rows = await cursor.fetchall()
+            except asyncio.CancelledError:
+                # The close queues behind the statement, so interrupt first
+                await conn.interrupt()
+                await cursor.close()
+                raise
+            await cursor.close()
+            return rows
+
+    def _tag(self, caller):
+        # A caller's requests are spaced one apart from where service is now
+        tag = max(self._virtual, self._finish.get(caller, 0))
+        self._finish[caller] = tag + 1
+        if len(self._finish) > 1024:
+            self._finish = {c: f for c, f in self._finish.items()
+                            if f > self._virtual}
+        return tag
+
+    async def acquire(self, priority=0, caller=None):
+        if self._closed:
+            raise RuntimeError("Query gateway is closed")
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        tag = self._tag(caller)
+        if self._busy < self.max_connections and not self._waiting:
+            self._busy += 1
+            self._virtual = tag
+        else:
+            if self.max_queue is not None and self._waiting >= self.max_queue:
+                self.rejected += 1
+                raise GatewayFull(f"{self._waiting} queries already waiting")
+            future = loop.create_future()
+            heapq.heappush(self._queue, (priority, tag, next(self._seq), future))
+            self._waiting += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._waiting)
+            try:
+                await future
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                if future.cancelled():
+                    self._waiting -= 1
+                else:
+                    # Granted a slot in the same tick it was cancelled
+                    self._release_slot()
+                raise
+        if self._closed:
+            self._release_slot()
+            raise RuntimeError("Query gateway is closed")
+        waited = loop.time() - start
+        self.granted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        try:
+            if self._idle:
+                return self._idle.pop()
+            conn = await aiosqlite.connect(self.database)
+            self.opened += 1
+            return conn
+        except BaseException:
+            self._release_slot()
+            raise
+
+    async def release(self, conn, commit=True):
+        try:
+            if conn.in_transaction:
+                if commit:
+                    await conn.commit()
+                else:
+                    await conn.rollback()
+        finally:
+            self.completed += 1
+            if self._closed:
+                await conn.close()
+            else:
+                self._idle.append(conn)
+            self._release_slot()
+
+    def _release_slot(self):
+        # Hand the slot straight to the next live waiter, if any
+        while self._queue:
+            _, tag, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                self._waiting -= 1
+                self._virtual = tag
+                future.set_result(None)
+                return
+        self._busy -= 1
+
+    async def close(self):
+        # Connections still lent out are closed as they come back
+        self._closed = True
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await conn.close()
+
+    def stats(self):
+        return {
+            "max_connections": self.max_connections,
+            "opened": self.opened,
+            "in_flight": self._busy,
+            "queue_depth": self._waiting,
+            "max_queue_depth": self.max_queue_depth,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "interrupted": self.interrupted,
+            "rejected": self.rejected,
+            "mean_wait_ms": round(self.total_wait / max(self.granted, 1) * 1000, 3),
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+        }
+
+async def fetch_all_users_bounded(queries=1000):
+    async with QueryGateway(max_connections=4) as gateway:
+        results = await asyncio.gather(*(
+            gateway.fetch("SELECT * FROM users WHERE id = ?", (i % 100 + 1,))
+            for i in range(queries)))
+        print(f"{len(results)} queries:", gateway.stats())
+
+if __name__ == "__main__":
+    asyncio.run(fetch_all_users_bounded())
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the database context managers.
+
+Each bench_* function prints its own report; run the module to execute
+all of them. Every benchmark builds its own users.db in a temporary
+directory.
+"""
+import asyncio
+import contextlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import aiosqlite
+
+connection_module = __import__("0-databaseconnection")
+execute_module = __import__("1-execute")
+executor_module = __import__("4-async_executor")
+gateway_module = __import__("5-query_gateway")
+
+
+@contextlib.contextmanager
+def users_db(rows=10_000):
+    # The context managers open "users.db" relative to the working directory
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        conn = sqlite3.connect("users.db")
+        conn.execute(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, "
+            "email TEXT, age INTEGER)"
+        )
+        conn.executemany(
+            "INSERT INTO users VALUES (?, ?, ?, ?)",
+            [(i, f"User {i}", f"user{i}@example.com", 18 + i % 60)
+             for i in range(1, rows + 1)],
+        )
+        conn.commit()
+        conn.close()
+        try:
+            yield
+        finally:
+            connection_module.close_pools()
+            os.chdir(cwd)
+
+
+class ConnectPerBlock:
+    # DatabaseConnection as it was before pooling
+    def __enter__(self):
+        self.conn = sqlite3.connect("users.db")
+        return self.conn
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.conn.close()
+
+
+def bench_enter_exit(cycles=20_000):
+    with users_db():
+        print(f"DatabaseConnection enter/exit, {cycles} cycles with a point lookup")
+        for name, manager in [("connect per block", ConnectPerBlock),
+                              ("pooled", connection_module.DatabaseConnection)]:
+            start = time.perf_counter()
+            for i in range(cycles):
+                with manager() as conn:
+                    conn.execute("SELECT * FROM users WHERE id = ?",
+                                 (i % 100 + 1,)).fetchone()
+            elapsed = time.perf_counter() - start
+            print(f"{name:>18} {cycles / elapsed:>10,.0f} cycles/s")
+        print(connection_module.get_pool().stats())
+
+
+def bench_execute_memory(rows=500_000):
+    query = "SELECT * FROM users WHERE age > ?"
+    with users_db(rows):
+        print(f"ExecuteQuery over {rows} users, peak traced memory")
+        variants = [("fetchall", {})]
+        variants += [(f"stream {size} {fmt}", {"stream": True,
+                                             "chunk_size": size, "rows": fmt})
+                     for size in (100, 1000) for fmt in ("tuple", "namedtuple")]
+        variants.append(("stream 1000 dict", {"stream": True, "rows": "dict"}))
+        for name, options in variants:
+            tracemalloc.start()
+            start = time.perf_counter()
+            with execute_module.ExecuteQuery(query, (25,), **options) as results:
+                total = sum(row[3] if not isinstance(row, dict) else row["age"]
+                            for row in results)
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{name:>24} {peak / 2**20:>8.2f} MB {elapsed * 1000:>8.0f} ms"
+                  f"  (sum {total})")
+
+
+async def connect_per_fetch(query, params=()):
+    # async_fetch_users / async_fetch_older_users as they were
+    async with aiosqlite.connect("users.db") as db:
+        async with db.execute(query, params) as cursor:
+            return await cursor.fetchall()
+
+
+def bench_concurrent_fetchers(rows=50_000, fetchers=(2, 10, 50)):
+    # Alternating full scans and age > 40 subsets, all gathered at once
+    async def per_fetch(n):
+        await asyncio.gather(*(
+            connect_per_fetch("SELECT * FROM users") if i % 2 == 0 else
+            connect_per_fetch("SELECT * FROM users WHERE age > ?", (40,))
+            for i in range(n)))
+        return n
+
+    async def executor(n):
+        async with executor_module.AsyncQueryExecutor() as db:
+            await asyncio.gather(*(
+                db.fetch("users") if i % 2 == 0 else
+                db.fetch("users", where=("age", ">", 40))
+                for i in range(n)))
+        return db.queries
+
+    with users_db(rows):
+        print(f"N concurrent fetchers over {rows} users")
+        for n in fetchers:
+            for name, run in [("connect per fetch", per_fetch),
+                              ("shared executor", executor)]:
+                start = time.perf_counter()
+                queries = asyncio.run(run(n))
+                elapsed = time.perf_counter() - start
+                print(f"{n:>4} {name:>18} {elapsed * 1000:>8.1f} ms, "
+                      f"{queries} queries")
+
+
+async def peak_threads(coro):
+    # Samples the thread count while coro runs; aiosqlite uses one each
+    peak = threading.active_count()
+    task = asyncio.ensure_future(coro)
+    while not task.done():
+        peak = max(peak, threading.active_count())
+        await asyncio.sleep(0.001)
+    return await task, peak
+
+
+def bench_gateway_fan_out(fan_out=(1_000, 10_000)):
+    query = "SELECT * FROM users WHERE id = ?"
+
+    async def unbounded(n):
+        await asyncio.gather(*(connect_per_fetch(query, (i % 1000 + 1,))
+                               for i in range(n)))
+
+    async def gateway(n):
+        async with gateway_module.QueryGateway(max_connections=4) as gw:
+            await asyncio.gather(*(gw.fetch(query, (i % 1000 + 1,))
+                                   for i in range(n)))
+        return gw.stats()
+
+    with users_db():
+        print("gathered point lookups")
+        for n in fan_out:
+            variants = [("gateway(4)", gateway)]
+            if n <= 1_000:
+                variants.insert(0, ("connect per query", unbounded))
+            for name, run in variants:
+                start = time.perf_counter()
+                stats, peak = asyncio.run(peak_threads(run(n)))
+                elapsed = time.perf_counter() - start
+                line = (f"{n:>6} {name:>18} {elapsed * 1000:>8.0f} ms, "
+                        f"peak {peak} threads")
+                if stats:
+                    line += (f", max queue {stats['max_queue_depth']}, "
+                             f"mean wait {stats['mean_wait_ms']:.1f} ms")
+                print(line)
+
+
+if __name__ == "__main__":
+    bench_enter_exit()
+    bench_execute_memory()
+    bench_concurrent_fetchers()
+    bench_gateway_fan_out()
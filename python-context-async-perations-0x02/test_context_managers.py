@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Unittests for the database context managers.
+"""
+
+import asyncio
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+connection_module = __import__("0-databaseconnection")
+execute_module = __import__("1-execute")
+concurrent_module = __import__("3-concurrent")
+executor_module = __import__("4-async_executor")
+gateway_module = __import__("5-query_gateway")
+QueryGateway = gateway_module.QueryGateway
+DatabaseConnection = connection_module.DatabaseConnection
+ExecuteQuery = execute_module.ExecuteQuery
+
+
+class UsersDbTestCase(unittest.TestCase):
+    """
+    Base case running inside a temporary directory holding users.db.
+    """
+
+    users = 8
+
+    def setUp(self) -> None:
+        """Create users.db in a fresh working directory."""
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        conn = sqlite3.connect("users.db")
+        conn.execute(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, "
+            "email TEXT, age INTEGER)")
+        conn.executemany(
+            "INSERT INTO users VALUES (?, ?, ?, ?)",
+            [(i, f"User {i}", f"user{i}@example.com", 20 + i * 5)
+             for i in range(1, self.users + 1)])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self) -> None:
+        """Leave and remove the working directory."""
+        connection_module.close_pools()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def name_of(self, user_id):
+        """Read one name straight from the file."""
+        conn = sqlite3.connect("users.db")
+        name = conn.execute(
+            "SELECT name FROM users WHERE id = ?", (user_id,)).fetchone()[0]
+        conn.close()
+        return name
+
+
+class TestDatabaseConnection(UsersDbTestCase):
+    """
+    Tests for the pooled DatabaseConnection.
+    """
+
+    def test_connection_reused_across_blocks(self) -> None:
+        """Test ten blocks in a row open a single connection."""
+        seen = set()
+        for _ in range(10):
+            with DatabaseConnection() as conn:
+                seen.add(id(conn))
+                conn.execute("SELECT * FROM users").fetchall()
+        stats = connection_module.get_pool().stats()
+        self.assertEqual(len(seen), 1)
+        self.assertEqual((stats["created"], stats["checkouts"]), (1, 10))
+        self.assertEqual((stats["idle"], stats["in_use"]), (1, 0))
+
+    def test_clean_exit_commits(self) -> None:
+        """Test writes are committed when the block succeeds."""
+        with DatabaseConnection() as conn:
+            conn.execute("UPDATE users SET name = 'Kept' WHERE id = 1")
+        self.assertEqual(self.name_of(1), "Kept")
+        self.assertEqual(connection_module.get_pool().stats()["commits"], 1)
+
+    def test_exception_rolls_back(self) -> None:
+        """Test writes are undone when the block raises."""
+        with self.assertRaises(ValueError):
+            with DatabaseConnection() as conn:
+                conn.execute("UPDATE users SET name = 'Lost' WHERE id = 1")
+                raise ValueError("abort")
+        self.assertEqual(self.name_of(1), "User 1")
+        stats = connection_module.get_pool().stats()
+        self.assertEqual((stats["rollbacks"], stats["idle"]), (1, 1))
+
+    def test_database_error_discards_connection(self) -> None:
+        """Test a connection that raised a database error is not reused."""
+        with self.assertRaises(sqlite3.OperationalError):
+            with DatabaseConnection() as conn:
+                conn.execute("SELEC 1")
+        stats = connection_module.get_pool().stats()
+        self.assertEqual((stats["discarded"], stats["open"]), (1, 0))
+
+    def test_pool_size_bounds_connections(self) -> None:
+        """Test callers wait for a free connection, then time out."""
+        pool = connection_module.get_pool(max_size=2, timeout=0.05)
+        first, second = pool.acquire(), pool.acquire()
+        with self.assertRaises(TimeoutError):
+            pool.acquire()
+        threading.Timer(0.01, pool.release, (first,)).start()
+        self.assertIs(pool.acquire(timeout=1), first)
+        pool.release(first)
+        pool.release(second)
+        stats = pool.stats()
+        self.assertEqual((stats["open"], stats["waits"]), (2, 2))
+        self.assertGreater(stats["wait_seconds"], 0)
+
+
+class TestExecuteQuery(UsersDbTestCase):
+    """
+    Tests for ExecuteQuery and its streaming mode.
+    """
+
+    query = "SELECT id, name, age FROM users WHERE age > ?"
+
+    def test_default_returns_all_rows(self) -> None:
+        """Test the default mode still returns a list of tuples."""
+        with ExecuteQuery(self.query, (25,)) as results:
+            self.assertIsInstance(results, list)
+            self.assertEqual(len(results), 7)
+            self.assertEqual(results[0], (2, "User 2", 30))
+
+    def test_stream_fetches_in_chunks(self) -> None:
+        """Test streaming reads chunk_size rows at a time, lazily."""
+        manager = ExecuteQuery(self.query, (25,), stream=True, chunk_size=3)
+        with manager as rows:
+            manager.cursor = mock.Mock(wraps=manager.cursor)
+            self.assertEqual(manager.cursor.fetchmany.call_count, 0)
+            ids = [row[0] for row in rows]
+        self.assertEqual(ids, list(range(2, 9)))
+        self.assertEqual(manager.cursor.fetchmany.call_args_list,
+                         [mock.call(3)] * 4)
+
+    def test_row_formats(self) -> None:
+        """Test dict and namedtuple rows carry the column names."""
+        with ExecuteQuery(self.query, (55,), rows="dict") as results:
+            self.assertEqual(results, [{"id": 8, "name": "User 8", "age": 60}])
+        with ExecuteQuery(self.query, (55,), stream=True,
+                          rows="namedtuple") as rows:
+            row = next(rows)
+        self.assertEqual((row.id, row.name, row.age), (8, "User 8", 60))
+        self.assertFalse(hasattr(row, "__dict__"))
+        with self.assertRaises(ValueError):
+            ExecuteQuery(self.query, rows="list")
+
+    def test_early_exit_returns_connection(self) -> None:
+        """Test leaving the block mid-stream hands the connection back."""
+        with ExecuteQuery(self.query, (0,), stream=True, chunk_size=2) as rows:
+            next(rows)
+        with ExecuteQuery("SELECT COUNT(*) FROM users") as results:
+            self.assertEqual(results, [(self.users,)])
+        stats = connection_module.get_pool().stats()
+        self.assertEqual((stats["created"], stats["in_use"]), (1, 0))
+
+
+class TestAsyncQueryExecutor(UsersDbTestCase):
+    """
+    Tests for read merging in 4-async_executor.AsyncQueryExecutor.
+    """
+
+    def run_reads(self, *reads, pool_size=2):
+        """Gather reads submitted in one tick; return results and executor."""
+        async def main():
+            async with executor_module.AsyncQueryExecutor(
+                    pool_size=pool_size) as db:
+                results = await asyncio.gather(
+                    *(read(db) for read in reads), return_exceptions=True)
+            return results, db
+        return asyncio.run(main())
+
+    def sql_rows(self, query, params=()):
+        """Run a query straight against the file."""
+        conn = sqlite3.connect("users.db")
+        rows = conn.execute(query, params).fetchall()
+        conn.close()
+        return rows
+
+    def test_subset_derived_from_full_scan(self) -> None:
+        """Test a filtered read alongside a full scan costs no query."""
+        (users, older), db = self.run_reads(
+            lambda db: db.fetch("users"),
+            lambda db: db.fetch("users", where=("age", ">", 40)))
+        self.assertEqual(users, self.sql_rows("SELECT * FROM users"))
+        self.assertEqual(older, self.sql_rows(
+            "SELECT * FROM users WHERE age > 40"))
+        self.assertEqual((db.requests, db.queries, db.merged), (2, 1, 1))
+
+    def test_filters_without_scan_run_separately(self) -> None:
+        """Test distinct filters each run, identical ones once."""
+        (a, b, c), db = self.run_reads(
+            lambda db: db.fetch("users", where=("age", ">", 40)),
+            lambda db: db.fetch("users", where=("age", ">", 40)),
+            lambda db: db.fetch("users", where=("age", "<=", 30)))
+        self.assertEqual(a, b)
+        self.assertIsNot(a, b)
+        self.assertEqual(c, self.sql_rows("SELECT * FROM users WHERE age <= 30"))
+        self.assertEqual((db.queries, db.merged), (2, 1))
+
+    def test_identical_sql_coalesced_and_errors_shared(self) -> None:
+        """Test raw queries are deduplicated and failures reach each caller."""
+        query = "SELECT name FROM users WHERE id = ?"
+        (first, second, broken), db = self.run_reads(
+            lambda db: db.execute(query, (1,)),
+            lambda db: db.execute(query, (1,)),
+            lambda db: db.execute("SELEC 1"))
+        self.assertEqual(first, [("User 1",)])
+        self.assertEqual(second, first)
+        self.assertIsInstance(broken, sqlite3.OperationalError)
+        self.assertEqual(db.queries, 2)
+
+    def test_uncomparable_values_fall_back_to_sql(self) -> None:
+        """Test a filter Python can't evaluate is sent to SQLite instead."""
+        (_, rows), db = self.run_reads(
+            lambda db: db.fetch("users"),
+            lambda db: db.fetch("users", where=("age", ">", "40")))
+        self.assertEqual(rows, self.sql_rows(
+            "SELECT * FROM users WHERE age > ?", ("40",)))
+        self.assertEqual((db.queries, db.merged), (2, 0))
+
+    def test_unhashable_parameters_fail_their_caller(self) -> None:
+        """Test a list parameter raises at submit and others still run."""
+        async def main():
+            async with executor_module.AsyncQueryExecutor() as db:
+                good = db.execute("SELECT name FROM users WHERE id = ?", (1,))
+                with self.assertRaises(TypeError):
+                    db.execute("SELECT * FROM users WHERE id IN (?)", [[1]])
+                with self.assertRaises(TypeError):
+                    db.fetch("users", where=("id", "=", [1]))
+                return await asyncio.wait_for(good, 5)
+
+        self.assertEqual(asyncio.run(main()), [("User 1",)])
+
+    def test_failed_flush_fails_every_request(self) -> None:
+        """Test an error while planning a tick reaches all its callers."""
+        async def main():
+            async with executor_module.AsyncQueryExecutor() as db:
+                db._plan = lambda pending: 1 / 0
+                reads = [db.fetch("users"), db.execute("SELECT 1")]
+                return await asyncio.wait_for(
+                    asyncio.gather(*reads, return_exceptions=True), 5)
+
+        results = asyncio.run(main())
+        self.assertEqual([type(r) for r in results], [ZeroDivisionError] * 2)
+
+    def test_pool_bounds_connections(self) -> None:
+        """Test many concurrent queries share pool_size connections."""
+        async def main():
+            async with executor_module.AsyncQueryExecutor(pool_size=3) as db:
+                results = await asyncio.gather(*(
+                    db.execute("SELECT * FROM users WHERE id = ?", (i,))
+                    for i in range(1, 21)))
+                opened = len(db._connections)
+            return results, opened, db
+
+        results, opened, db = asyncio.run(main())
+        self.assertEqual(len(results), 20)
+        self.assertEqual((db.queries, opened), (20, 3))
+        self.assertEqual(db._connections, [])
+
+    def test_identifiers_are_validated(self) -> None:
+        """Test table and column names can't smuggle in SQL."""
+        with self.assertRaises(ValueError):
+            executor_module.read_query("users; DROP TABLE users")
+        with self.assertRaises(ValueError):
+            executor_module.read_query("users", ("age", "LIKE", 1))
+
+    def test_fetch_concurrently(self) -> None:
+        """Test the gathered fetchers print both result sets."""
+        out = io.StringIO()
+        with redirect_stdout(out):
+            asyncio.run(concurrent_module.fetch_concurrently())
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("All Users: [(1, "))
+        self.assertTrue(lines[1].startswith("Users older than 40: [(5, "))
+        self.assertEqual(asyncio.run(concurrent_module.async_fetch_older_users()),
+                         self.sql_rows("SELECT * FROM users WHERE age > 40"))
+
+
+class TestQueryGateway(UsersDbTestCase):
+    """
+    Tests for the bounded, prioritised 5-query_gateway.QueryGateway.
+    """
+
+    slow = ("WITH RECURSIVE r(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM r "
+            "WHERE x < 100000000) SELECT COUNT(*) FROM r")
+
+    def test_fan_out_is_bounded(self) -> None:
+        """Test 200 gathered queries never open more than the limit."""
+        async def main():
+            async with QueryGateway(max_connections=3) as gateway:
+                results = await asyncio.gather(*(
+                    gateway.fetch("SELECT name FROM users WHERE id = ?",
+                                  (i % self.users + 1,))
+                    for i in range(200)))
+            return results, gateway.stats()
+
+        results, stats = asyncio.run(main())
+        self.assertEqual(results[9], [("User 2",)])
+        self.assertEqual((stats["opened"], stats["completed"]), (3, 200))
+        self.assertEqual((stats["in_flight"], stats["queue_depth"]), (0, 0))
+        self.assertGreater(stats["max_queue_depth"], 0)
+        self.assertGreater(stats["max_wait_ms"], 0)
+
+    def grant_order(self, requests):
+        """Queue (priority, caller) requests behind a held slot."""
+        async def main():
+            order = []
+            async with QueryGateway(max_connections=1) as gateway:
+                async def request(label, priority, caller):
+                    async with gateway.connection(priority, caller):
+                        order.append(label)
+
+                async with gateway.connection():
+                    tasks = [asyncio.create_task(request(i, *r))
+                             for i, r in enumerate(requests)]
+                    await asyncio.sleep(0)
+                await asyncio.gather(*tasks)
+            return order
+        return asyncio.run(main())
+
+    def test_lower_priority_value_served_first(self) -> None:
+        """Test waiters are granted by priority, FIFO within one."""
+        order = self.grant_order([(5, "a"), (1, "b"), (3, "c"), (1, "d")])
+        self.assertEqual(order, [1, 3, 2, 0])
+
+    def test_callers_share_slots_fairly(self) -> None:
+        """Test a caller's backlog doesn't starve a later caller."""
+        order = self.grant_order([(0, "flood")] * 5 + [(0, "other")])
+        self.assertEqual(order.index(5), 1)
+
+    def test_cancelled_waiter_leaves_the_queue(self) -> None:
+        """Test cancelling a queued request frees its place."""
+        async def main():
+            async with QueryGateway(max_connections=1) as gateway:
+                async with gateway.connection():
+                    waiter = asyncio.create_task(gateway.fetch("SELECT 1"))
+                    await asyncio.sleep(0)
+                    self.assertEqual(gateway.stats()["queue_depth"], 1)
+                    waiter.cancel()
+                    await asyncio.sleep(0)
+                self.assertEqual(await gateway.fetch("SELECT 2"), [(2,)])
+            return gateway.stats()
+
+        stats = asyncio.run(main())
+        self.assertEqual((stats["cancelled"], stats["queue_depth"]), (1, 0))
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_cancel_interrupts_running_query(self) -> None:
+        """Test cancelling an in-flight query stops it in SQLite."""
+        async def main():
+            async with QueryGateway(max_connections=1) as gateway:
+                task = asyncio.create_task(gateway.fetch(self.slow))
+                await asyncio.sleep(0.05)
+                start = time.perf_counter()
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+                elapsed = time.perf_counter() - start
+                self.assertEqual(await gateway.fetch("SELECT 3"), [(3,)])
+            return elapsed, gateway.stats()
+
+        elapsed, stats = asyncio.run(main())
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(stats["interrupted"], 1)
+
+    def test_full_queue_rejects(self) -> None:
+        """Test max_queue pushes back instead of growing without bound."""
+        async def main():
+            async with QueryGateway(max_connections=1, max_queue=2) as gateway:
+                async with gateway.connection():
+                    waiters = [asyncio.create_task(gateway.fetch("SELECT 1"))
+                               for _ in range(2)]
+                    await asyncio.sleep(0)
+                    with self.assertRaises(gateway_module.GatewayFull):
+                        await gateway.fetch("SELECT 1")
+                await asyncio.gather(*waiters)
+            return gateway.stats()
+
+        self.assertEqual(asyncio.run(main())["rejected"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
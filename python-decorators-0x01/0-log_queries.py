@@ -1,24 +1,152 @@
-import sqlite3
+import sys
+import json
+import time
+import queue
+import atexit
+import inspect
 import functools
+import itertools
+import threading
 from datetime import datetime  # ✅ required by checker
 
-def log_queries(func):
+with_db_connection = __import__('1-with_db_connection').with_db_connection
+
+class QueryLogger:
+    # The calling thread only appends a tuple to a SimpleQueue; formatting
+    # and writing happen in batches on a background thread
+    def __init__(self, stream=None, sample=1, batch_size=512, flush_interval=0.2):
+        self.stream = stream
+        self.sample = sample
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        self._counter = itertools.count()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def sampled(self):
+        # Log 1 in `sample` calls; unsampled calls skip timing entirely
+        return self.sample <= 1 or next(self._counter) % self.sample == 0
+
+    def record(self, query, duration_ns, rows, params, error=None):
+        if self._thread is None:
+            self._start()
+        self._queue.put((time.time(), query, duration_ns, rows, params, error))
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name="query-logger",
+                                          daemon=True)
+                thread.start()
+                self._thread = thread
+                atexit.register(self.close)
+
+    def _format(self, record):
+        ts, query, duration_ns, rows, params, error = record
+        entry = {
+            "ts": datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S.%f'),
+            "query": query,
+            "duration_us": round(duration_ns / 1000, 1),
+            "rows": rows,
+            "params": params,
+        }
+        if error is not None:
+            entry["error"] = error
+        # Queries and params may be any object, e.g. a connection
+        return json.dumps(entry, default=repr)
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            lines = []
+            for record in batch:
+                if record is None:
+                    continue
+                # One bad record must not take the writer thread down
+                try:
+                    lines.append(self._format(record))
+                except Exception as e:
+                    lines.append(json.dumps({"query": repr(record[1]),
+                                             "log_error": repr(e)}))
+            if lines:
+                try:
+                    stream = self.stream or sys.stdout
+                    stream.write("\n".join(lines) + "\n")
+                    stream.flush()
+                except Exception:
+                    pass
+            if stop:
+                return
+
+    def close(self):
+        # Flushes everything recorded so far; the logger restarts on next use
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+query_logger = QueryLogger()
+
+def row_count(result):
+    if isinstance(result, list):
+        return len(result)
+    return 0 if result is None else 1
+
+def log_queries(func=None, *, logger=None):
+    if func is None:
+        return lambda f: log_queries(f, logger=logger)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            log = query_logger if logger is None else logger
+            if not log.sampled():
+                return await func(*args, **kwargs)
+            query = kwargs.get('query') or (args[0] if args else '')
+            params = max(len(args) + len(kwargs) - 1, 0)
+            start = time.perf_counter_ns()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                log.record(query, time.perf_counter_ns() - start, 0, params, repr(e))
+                raise
+            log.record(query, time.perf_counter_ns() - start, row_count(result), params)
+            return result
+        return async_wrapper
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
+        log = query_logger if logger is None else logger
+        if not log.sampled():
+            return func(*args, **kwargs)
         query = kwargs.get('query') or (args[0] if args else '')
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        print(f"[{timestamp}] Executing SQL Query: {query}")
-        return func(*args, **kwargs)
+        params = max(len(args) + len(kwargs) - 1, 0)
+        start = time.perf_counter_ns()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            log.record(query, time.perf_counter_ns() - start, 0, params, repr(e))
+            raise
+        log.record(query, time.perf_counter_ns() - start, row_count(result), params)
+        return result
     return wrapper
 
 @log_queries
-def fetch_all_users(query):
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    cursor.execute(query)
-    results = cursor.fetchall()
-    conn.close()
-    return results
+@with_db_connection
+def fetch_all_users(conn, query):
+    cursor = conn.execute_cached(query)
+    return cursor.fetchall()
 
 # Test the function
 if __name__ == "__main__":
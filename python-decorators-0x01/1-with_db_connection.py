@@ -1,22 +1,249 @@
+import os
+import time
+import inspect
 import sqlite3
+import weakref
 import functools
+import threading
+from collections import OrderedDict
+
+try:
+    import aiosqlite
+except ImportError:
+    aiosqlite = None
+
+DB_PATH = 'users.db'
+
+CONNECTION_TYPES = (sqlite3.Connection,)
+if aiosqlite is not None:
+    CONNECTION_TYPES += (aiosqlite.Connection,)
+
+# Applied once when a pooled connection is opened, not on every checkout
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=268435456",
+)
+
+STATEMENT_CACHE_SIZE = 128
+
+class PooledConnection(sqlite3.Connection):
+    # sqlite3 keeps the last cached_statements compiled statements per
+    # connection, keyed on SQL text. execute_cached mirrors that LRU to
+    # count hits; every call still gets a cursor of its own.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements = OrderedDict()
+        self.statement_hits = 0
+        self.statement_misses = 0
+
+    def execute_cached(self, sql, params=()):
+        if sql in self.statements:
+            self.statement_hits += 1
+            self.statements.move_to_end(sql)
+        else:
+            self.statement_misses += 1
+            self.statements[sql] = None
+            if len(self.statements) > STATEMENT_CACHE_SIZE:
+                self.statements.popitem(last=False)
+        return self.execute(sql, params)
+
+class ConnectionPool:
+    def __init__(self, database=DB_PATH, max_size=8, idle_timeout=60.0,
+                 pragmas=PRAGMAS, busy_timeout=5.0):
+        self.database = database
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.pragmas = pragmas
+        self.busy_timeout = busy_timeout
+        self._idle = []
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._setup_lock = threading.Lock()
+        self._connections = weakref.WeakSet()
+        self.checkouts = 0
+        self.waits = 0
+        self.reaped = 0
+
+    def connect(self):
+        conn = sqlite3.connect(self.database, timeout=self.busy_timeout,
+                               check_same_thread=False,
+                               factory=PooledConnection,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        # Switching journal_mode doesn't wait on the busy timeout, so
+        # connections opened at once must not race each other to WAL
+        with self._setup_lock:
+            for pragma in self.pragmas:
+                conn.execute(pragma)
+        self._connections.add(conn)
+        return conn
+
+    def _reap(self):
+        # The stack is oldest-first, so expired connections sit at the bottom
+        deadline = time.monotonic() - self.idle_timeout
+        while self._idle and self._idle[0][1] < deadline:
+            self._idle.pop(0)[0].close()
+            self._size -= 1
+            self.reaped += 1
+
+    def acquire(self, timeout=None):
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                self._reap()
+                if self._idle:
+                    self.checkouts += 1
+                    return self._idle.pop()[0]
+                if self._size < self.max_size:
+                    self._size += 1
+                    self.checkouts += 1
+                    break
+                self.waits += 1
+                if not self._cond.wait(timeout):
+                    raise TimeoutError(
+                        f"No connection to {self.database} within {timeout}s")
+        try:
+            return self.connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self.discard(conn)
+            return
+        with self._cond:
+            if self._closed:
+                conn.close()
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def discard(self, conn):
+        conn.close()
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                conn.close()
+                self._size -= 1
+            self._idle.clear()
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            hits = sum(c.statement_hits for c in self._connections)
+            misses = sum(c.statement_misses for c in self._connections)
+            return {
+                "open": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "reaped": self.reaped,
+                "statement_hits": hits,
+                "statement_misses": misses,
+                "statement_hit_rate": hits / max(hits + misses, 1),
+            }
+
+pools = {}
+pools_lock = threading.Lock()
+
+def get_pool(database=DB_PATH, **options):
+    # One pool per database file, however the path is spelled
+    path = os.path.abspath(database)
+    pool = pools.get(path)
+    if pool is None:
+        with pools_lock:
+            pool = pools.get(path)
+            if pool is None:
+                pool = pools[path] = ConnectionPool(path, **options)
+    return pool
+
+def close_pools():
+    with pools_lock:
+        for pool in pools.values():
+            pool.close()
+        pools.clear()
+
+def give_back(pool, conn, error=None):
+    # Don't hand a connection that just failed to the next caller;
+    # constraint violations say nothing about the connection itself
+    if (isinstance(error, sqlite3.DatabaseError)
+            and not isinstance(error, sqlite3.IntegrityError)):
+        pool.discard(conn)
+    else:
+        pool.release(conn)
+
+class Checkout:
+    # A pooled connection taken only when entered. with_db_connection
+    # passes one to functions marked lazy_connection, such as group commit
+    # members, so callers that end up not running SQL hold no connection.
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = None
+
+    def __enter__(self):
+        self.conn = self.pool.acquire()
+        return self.conn
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        conn, self.conn = self.conn, None
+        give_back(self.pool, conn, exc_val)
+
+def with_async_db_connection(func):
+    if aiosqlite is None:
+        raise RuntimeError("aiosqlite is required to wrap coroutine functions")
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        # aiosqlite parks each connection on its own thread, so one per call
+        # leaves nothing behind once the event loop that opened it is gone
+        async with aiosqlite.connect(DB_PATH, timeout=5.0) as conn:
+            return await func(conn, *args, **kwargs)
+    return wrapper
 
 def with_db_connection(func):
+    if inspect.iscoroutinefunction(func):
+        return with_async_db_connection(func)
+    if getattr(func, 'lazy_connection', False):
+        @functools.wraps(func)
+        def lazy(*args, **kwargs):
+            return func(Checkout(get_pool(DB_PATH)), *args, **kwargs)
+        return lazy
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        conn = sqlite3.connect('users.db')
+        pool = get_pool(DB_PATH)
+        conn = pool.acquire()
         try:
-            return func(conn, *args, **kwargs)
-        finally:
-            conn.close()
+            result = func(conn, *args, **kwargs)
+        except BaseException as e:
+            give_back(pool, conn, e)
+            raise
+        pool.release(conn)
+        return result
     return wrapper
 
 @with_db_connection
 def get_user_by_id(conn, user_id):
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+    cursor = conn.execute_cached("SELECT * FROM users WHERE id = ?", (user_id,))
     return cursor.fetchone()
 
-# Fetch user by ID
-user = get_user_by_id(user_id=1)
-print(user)
+if __name__ == "__main__":
+    # Fetch user by ID
+    user = get_user_by_id(user_id=1)
+    print(user)
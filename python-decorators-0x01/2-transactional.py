@@ -1,24 +1,202 @@
-import sqlite3
+import re
+import inspect
 import functools
+import threading
 
-def with_db_connection(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        conn = sqlite3.connect('users.db')
+WRITE_PATTERN = re.compile(
+    r'\b(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?'
+    r'|DELETE\s+FROM|DROP\s+TABLE(?:\s+IF\s+EXISTS)?|ALTER\s+TABLE)'
+    r'\s+([\w."`\[\]]+)',
+    re.IGNORECASE,
+)
+
+commit_listeners = []
+
+def table_name(token):
+    # "main"."users" / [users] / `users` -> users
+    return token.split('.')[-1].strip('"`[]').lower()
+
+def written_tables(sql):
+    return {table_name(match) for match in WRITE_PATTERN.findall(sql)}
+
+def on_commit(listener):
+    # listener(tables) runs just before and again just after each commit
+    commit_listeners.append(listener)
+    return listener
+
+def notify(tables):
+    for listener in commit_listeners:
+        listener(tables)
+
+def touched_tables(statements):
+    tables = set()
+    for sql in statements:
+        tables |= written_tables(sql)
+    return tables
+
+pool_module = __import__('1-with_db_connection')
+with_db_connection = pool_module.with_db_connection
+
+class Member:
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class Batch:
+    def __init__(self):
+        self.members = []
+        self.full = threading.Event()
+
+class GroupCommit:
+    # Calls that arrive while another batch is committing, or within
+    # `window` seconds, run on one caller's connection and share a single
+    # commit, up to max_ops per batch. Every member runs inside its own
+    # savepoint, so one failing rolls back only its own writes. Members
+    # must not commit or roll back themselves. Under with_db_connection
+    # only the leader checks a connection out of the pool, so a batch can
+    # grow past the pool size.
+    def __init__(self, window=0.0, max_ops=64):
+        self.window = window
+        self.max_ops = max_ops
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._open = None
+        self.batches = 0
+        self.members = 0
+
+    def submit(self, conn, func, args, kwargs):
+        member = Member(func, args, kwargs)
+        with self._lock:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = Batch()
+            batch.members.append(member)
+            if len(batch.members) >= self.max_ops:
+                self._open = None
+                batch.full.set()
+        if leader:
+            if self.window:
+                batch.full.wait(self.window)
+            # One batch commits at a time; arrivals meanwhile form the next
+            with self._commit_lock:
+                with self._lock:
+                    if self._open is batch:
+                        self._open = None
+                if isinstance(conn, pool_module.Checkout):
+                    self.run_pooled(conn, batch.members)
+                else:
+                    self.run(conn, batch.members)
+        member.done.wait()
+        if member.error is not None:
+            raise member.error
+        return member.result
+
+    def run_pooled(self, checkout, members):
+        try:
+            with checkout as conn:
+                self.run(conn, members)
+        except BaseException as e:
+            # No connection to be had; nobody may be left waiting
+            for member in members:
+                if not member.done.is_set():
+                    member.error = e
+                    member.done.set()
+
+    def run(self, conn, members):
+        statements = []
+        conn.set_trace_callback(statements.append)
         try:
-            return func(conn, *args, **kwargs)
+            conn.execute("BEGIN")
+            for member in members:
+                conn.execute("SAVEPOINT member")
+                try:
+                    member.result = member.func(conn, *member.args, **member.kwargs)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO member")
+                    member.error = e
+                conn.execute("RELEASE member")
+            conn.set_trace_callback(None)
+            # Includes writes rolled back to a savepoint; invalidating a
+            # little more than needed is harmless
+            tables = touched_tables(statements)
+            if tables:
+                notify(tables)
+            conn.commit()
+            if tables:
+                notify(tables)
+        except BaseException as e:
+            conn.set_trace_callback(None)
+            if conn.in_transaction:
+                conn.rollback()
+            for member in members:
+                if member.error is None:
+                    member.error = e
         finally:
-            conn.close()
+            with self._lock:
+                self.batches += 1
+                self.members += len(members)
+            for member in members:
+                member.done.set()
+
+def async_transactional(func):
+    @functools.wraps(func)
+    async def wrapper(conn, *args, **kwargs):
+        statements = []
+        await conn.set_trace_callback(statements.append)
+        try:
+            result = await func(conn, *args, **kwargs)
+            await conn.set_trace_callback(None)
+            tables = touched_tables(statements)
+            if tables:
+                notify(tables)
+            await conn.commit()
+            if tables:
+                notify(tables)
+            return result
+        except Exception as e:
+            await conn.set_trace_callback(None)
+            await conn.rollback()
+            raise e
     return wrapper
 
-def transactional(func):
+def transactional(func=None, *, group=None):
+    # group: a GroupCommit shared by the calls that may commit together
+    if func is None:
+        return lambda f: transactional(f, group=group)
+    if inspect.iscoroutinefunction(func):
+        if group is not None:
+            raise TypeError("group commit needs a sync function")
+        return async_transactional(func)
+    if group is not None:
+        @functools.wraps(func)
+        def grouped(conn, *args, **kwargs):
+            return group.submit(conn, func, args, kwargs)
+        grouped.lazy_connection = True
+        return grouped
+
     @functools.wraps(func)
     def wrapper(conn, *args, **kwargs):
+        statements = []
+        conn.set_trace_callback(statements.append)
         try:
             result = func(conn, *args, **kwargs)
+            conn.set_trace_callback(None)
+            tables = touched_tables(statements)
+            # Before: readers still running can't cache pre-commit rows.
+            # After: drops anything cached while the commit was in flight.
+            if tables:
+                notify(tables)
             conn.commit()
+            if tables:
+                notify(tables)
             return result
         except Exception as e:
+            conn.set_trace_callback(None)
             conn.rollback()
             raise e
     return wrapper
@@ -29,5 +207,6 @@ def update_user_email(conn, user_id, new_email):
     cursor = conn.cursor()
     cursor.execute("UPDATE users SET email = ? WHERE id = ?", (new_email, user_id))
 
-# Update user's email
-update_user_email(user_id=1, new_email='Crawford_Cartwright@hotmail.com')
+if __name__ == "__main__":
+    # Update user's email
+    update_user_email(user_id=1, new_email='Crawford_Cartwright@hotmail.com')
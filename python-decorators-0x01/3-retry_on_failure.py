@@ -1,38 +1,117 @@
 import time
+import random
+import asyncio
+import inspect
 import sqlite3
 import functools
+import threading
+
+with_db_connection = __import__('1-with_db_connection').with_db_connection
+
+TRANSIENT_ERRORS = ('database is locked', 'database table is locked', 'database is busy')
+
+class RetryError(Exception):
+    pass
+
+def is_transient(error):
+    # Lock contention clears on its own; syntax or schema errors never will
+    return (isinstance(error, sqlite3.OperationalError)
+            and any(message in str(error).lower() for message in TRANSIENT_ERRORS))
+
+class RetryStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.attempts = 0
+        self.failures = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.attempt_counts = {}
+
+    def record(self, attempts, seconds, ok):
+        with self._lock:
+            self.calls += 1
+            self.attempts += attempts
+            self.failures += not ok
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self.attempt_counts[attempts] = self.attempt_counts.get(attempts, 0) + 1
+
+    def summary(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "attempts": self.attempts,
+                "retries": self.attempts - self.calls,
+                "failures": self.failures,
+                "mean_seconds": self.total_seconds / max(self.calls, 1),
+                "max_seconds": self.max_seconds,
+                "attempt_counts": dict(self.attempt_counts),
+            }
+
+def backoff(attempt, delay, max_delay):
+    # Full jitter: anywhere between 0 and the exponential ceiling
+    return random.uniform(0, min(max_delay, delay * 2 ** attempt))
+
+def retry_on_failure(retries=3, delay=2, max_delay=30.0, budget=None,
+                     retry_on=is_transient):
+    # retries counts attempts, so 0 would never call func at all
+    if retries < 1:
+        raise ValueError(f"retries must be at least 1, got {retries}")
 
-def with_db_connection(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        conn = sqlite3.connect('users.db')
-        try:
-            return func(conn, *args, **kwargs)
-        finally:
-            conn.close()
-    return wrapper
-
-def retry_on_failure(retries=3, delay=2):
     def decorator(func):
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            for attempt in range(retries):
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    print(f"Attempt {attempt+1} failed with error: {e}")
-                    time.sleep(delay)
-            raise Exception("All retry attempts failed.")
+        stats = RetryStats()
+
+        def pause_after(attempt, start, error):
+            # Called from the except block: re-raises unless a retry is due
+            elapsed = time.monotonic() - start
+            if not retry_on(error):
+                stats.record(attempt + 1, elapsed, False)
+                raise
+            pause = backoff(attempt, delay, max_delay)
+            last = attempt == retries - 1
+            if last or (budget is not None and elapsed + pause > budget):
+                stats.record(attempt + 1, elapsed, False)
+                raise RetryError("All retry attempts failed.") from error
+            print(f"Attempt {attempt+1} failed with error: {error}")
+            return pause
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = time.monotonic()
+                for attempt in range(retries):
+                    try:
+                        result = await func(*args, **kwargs)
+                    except Exception as e:
+                        await asyncio.sleep(pause_after(attempt, start, e))
+                    else:
+                        stats.record(attempt + 1, time.monotonic() - start, True)
+                        return result
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.monotonic()
+                for attempt in range(retries):
+                    try:
+                        result = func(*args, **kwargs)
+                    except Exception as e:
+                        time.sleep(pause_after(attempt, start, e))
+                    else:
+                        stats.record(attempt + 1, time.monotonic() - start, True)
+                        return result
+        wrapper.retry_stats = stats
         return wrapper
     return decorator
 
-@with_db_connection
+# Retry outside the connection so every attempt checks out its own
 @retry_on_failure(retries=3, delay=1)
+@with_db_connection
 def fetch_users_with_retry(conn):
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users")
+    cursor = conn.execute_cached("SELECT * FROM users")
     return cursor.fetchall()
 
-# Attempt to fetch users
-users = fetch_users_with_retry()
-print(users)
+if __name__ == "__main__":
+    # Attempt to fetch users
+    users = fetch_users_with_retry()
+    print(users)
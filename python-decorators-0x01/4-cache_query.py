@@ -1,29 +1,490 @@
+import os
+import re
+import sys
 import time
+import marshal
+import asyncio
+import inspect
 import sqlite3
+import weakref
 import functools
+import threading
+from collections import OrderedDict
 
-query_cache = {}
+transactional_module = __import__('2-transactional')
 
-def with_db_connection(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        conn = sqlite3.connect('users.db')
+# Entries whose tables can't be parsed are dropped by any write
+ALL_TABLES = '*'
+READ_PATTERN = re.compile(
+    r'\b(?:FROM|JOIN)\s+(.+?)(?=\b(?:WHERE|GROUP|ORDER|LIMIT|HAVING|UNION|'
+    r'INTERSECT|EXCEPT|JOIN|ON|USING|FROM|LEFT|RIGHT|INNER|OUTER|CROSS|NATURAL|'
+    r'WINDOW)\b|[();]|$)',
+    re.IGNORECASE | re.DOTALL,
+)
+
+caches = weakref.WeakSet()
+
+# Per-user, not the working directory: entries are loaded back as results.
+# One file serves every database; keys and counters name the database.
+DISK_CACHE_PATH = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+    'query_cache.db')
+
+pool_module = __import__('1-with_db_connection')
+with_db_connection = pool_module.with_db_connection
+
+def approx_size(obj):
+    # Rough deep size of a result set: containers plus their scalar members
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (list, tuple)):
+        size += sum(approx_size(item) for item in obj)
+    elif isinstance(obj, dict):
+        size += sum(approx_size(k) + approx_size(v) for k, v in obj.items())
+    return size
+
+def normalize(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, normalize(v)) for k, v in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(normalize(v) for v in value))
+    return value
+
+def read_tables(query):
+    tables = set()
+    for clause in READ_PATTERN.findall(query):
+        for part in clause.split(','):
+            words = part.split()
+            if words:
+                tables.add(transactional_module.table_name(words[0]))
+    return frozenset(tables) or frozenset([ALL_TABLES])
+
+def cache_key(query, args=(), kwargs=None):
+    # Whitespace-insensitive SQL plus every bound parameter
+    params = tuple(normalize(a) for a in args)
+    if kwargs:
+        params += tuple(sorted((k, normalize(v)) for k, v in kwargs.items()))
+    return (" ".join(query.split()), params)
+
+class Flight:
+    # One load in progress; concurrent misses on its key wait for it
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class DiskCache:
+    # Second tier that outlives the process. Each entry keeps the change
+    # counters of its tables as of when its query started; commits bump
+    # the counters here, so an entry written before a later commit, by
+    # this process or an earlier one, is refused on load. Values are
+    # stored with marshal, which only rebuilds plain data (rows of
+    # scalars), never arbitrary objects.
+    def __init__(self, path=DISK_CACHE_PATH, max_entries=100_000, database=None):
+        self.path = path
+        # The database with_db_connection opens, resolved now like the pool
+        self.database = os.path.abspath(database or pool_module.DB_PATH)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Losing the last few writes to a crash only costs a few misses
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, "
+            "value BLOB NOT NULL, expires REAL NOT NULL, versions TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS versions (name TEXT PRIMARY KEY, "
+            "version INTEGER NOT NULL)")
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def _key(self, key):
+        return repr((self.database, key))
+
+    def _names(self, tables):
+        return [f"{self.database}|{table}" for table in tables]
+
+    def versions(self, tables):
+        # Only the entry's own tables: every commit bumps ALL_TABLES
+        names = self._names(sorted(tables))
+        with self._lock:
+            found = dict(self._conn.execute(
+                f"SELECT name, version FROM versions WHERE name IN "
+                f"({','.join('?' * len(names))})", names))
+        return ",".join(str(found.get(name, 0)) for name in names)
+
+    def get(self, key, tables):
+        key = self._key(key)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires, versions FROM entries WHERE key = ?",
+                (key,)).fetchone()
+        if row is None or row[1] <= time.time():
+            self.misses += 1
+            return None
+        value = None
+        if row[2] == self.versions(tables):
+            try:
+                value = (marshal.loads(row[0]),)
+            except (ValueError, EOFError, TypeError):
+                # Corrupt, or written by another Python's marshal format
+                pass
+        if value is None:
+            self.rejected += 1
+            with self._lock:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            return None
+        self.hits += 1
+        return value[0], row[1] - time.time()
+
+    def set(self, key, value, ttl, versions):
         try:
-            return func(conn, *args, **kwargs)
+            blob = marshal.dumps(value)
+        except ValueError:
+            # Not plain data (e.g. sqlite3.Row); it stays in memory only
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                (self._key(key), blob, time.time() + ttl, versions))
+            self._writes += 1
+            if self._writes % 256 == 0:
+                self._trim()
+
+    def _trim(self):
+        # Soonest-expiring first, which is also roughly oldest first
+        count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries "
+                "ORDER BY expires LIMIT ?)", (count - self.max_entries,))
+
+    def invalidate_tables(self, tables):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO versions VALUES (?, 1) ON CONFLICT(name) "
+                "DO UPDATE SET version = version + 1",
+                [(name,) for name in self._names((ALL_TABLES, *tables))])
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class QueryCache:
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=300,
+                 disk=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk = disk
+        self._entries = OrderedDict()
+        self._by_table = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.flights = {}
+        self.tasks = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        caches.add(self)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    def get(self, key, count=True, stale=0):
+        # With stale > 0 an entry up to that many seconds past its TTL is
+        # still returned; the caller sees entry[1] in the past and refreshes
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] + stale <= now:
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if count:
+                self.hits += 1
+                self.stale_hits += entry[1] <= now
+            return entry
+
+    def _claim(self, key, tables, wait):
+        # -> (cached value, None, None) | (flight, leader, snapshot)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                # Cached by a load that finished after the caller's miss
+                return entry[0], None, None
+            snapshot = self._snapshot(tables)
+            flight = self.flights.get(key)
+            # A load started before a write committed can't answer for it
+            if flight is None or flight.snapshot != snapshot:
+                flight = self.flights[key] = Flight(snapshot)
+                return flight, True, snapshot
+            if wait:
+                self.coalesced += 1
+            return flight, False, None
+
+    def from_disk(self, key, tables, snapshot):
+        # Promotes a valid disk entry, keeping what is left of its TTL
+        if self.disk is None or ALL_TABLES in tables:
+            return None
+        found = self.disk.get(key, tables)
+        if found is not None:
+            self.set(key, found[0], found[1], tables, snapshot)
+        return found
+
+    def to_disk(self, key, value, ttl, tables, versions):
+        if versions is not None:
+            self.disk.set(key, value, self.ttl if ttl is None else ttl, versions)
+
+    def disk_versions(self, tables):
+        # Read before the query runs, like snapshot()
+        if self.disk is None or ALL_TABLES in tables:
+            return None
+        return self.disk.versions(tables)
+
+    def _run(self, key, flight, loader, ttl, tables, snapshot):
+        try:
+            found = self.from_disk(key, tables, snapshot)
+            if found is not None:
+                flight.result = found[0]
+                return flight.result
+            versions = self.disk_versions(tables)
+            flight.result = loader()
+        except BaseException as e:
+            flight.error = e
+            raise
+        else:
+            self.set(key, flight.result, ttl, tables, snapshot)
+            self.to_disk(key, flight.result, ttl, tables, versions)
+            return flight.result
         finally:
-            conn.close()
+            with self._lock:
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+            flight.done.set()
+
+    def load(self, key, loader, ttl=None, tables=frozenset([ALL_TABLES])):
+        # Single flight: the first miss runs loader(), later misses on the
+        # same key wait for it and share its result or its exception
+        flight, leader, snapshot = self._claim(key, tables, True)
+        if leader is None:
+            return flight
+        if leader:
+            return self._run(key, flight, loader, ttl, tables, snapshot)
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def refresh(self, key, loader, ttl=None, tables=frozenset([ALL_TABLES])):
+        # Reloads a stale entry on a background thread, once per key
+        flight, leader, snapshot = self._claim(key, tables, False)
+        if not leader:
+            return
+        self.refreshes += 1
+
+        def run():
+            try:
+                self._run(key, flight, loader, ttl, tables, snapshot)
+            except Exception:
+                # The stale entry keeps serving until its grace period ends
+                pass
+        threading.Thread(target=run, name="cache-refresh", daemon=True).start()
+
+    def snapshot(self, tables):
+        # Taken before running a query; set() refuses the result if a
+        # write to any of its tables committed in the meantime
+        with self._lock:
+            return self._snapshot(tables)
+
+    def _snapshot(self, tables):
+        # ALL_TABLES only counts for entries that depend on it, so a write
+        # to another table doesn't split single-flight loads of this one
+        return tuple(self._versions.get(name, 0) for name in sorted(tables))
+
+    def set(self, key, value, ttl=None, tables=frozenset([ALL_TABLES]),
+            snapshot=None):
+        ttl = self.ttl if ttl is None else ttl
+        size = approx_size(value)
+        with self._lock:
+            if snapshot is not None and snapshot != self._snapshot(tables):
+                return
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, time.monotonic() + ttl, size, tables)
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            self.bytes += size
+            while (len(self._entries) > self.max_entries
+                   or self.bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, _, size, tables = self._entries.pop(key)
+        self.bytes -= size
+        for table in tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def invalidate_tables(self, tables):
+        if self.disk is not None:
+            self.disk.invalidate_tables(tables)
+        with self._lock:
+            self._versions[ALL_TABLES] = self._versions.get(ALL_TABLES, 0) + 1
+            stale = set(self._by_table.get(ALL_TABLES, ()))
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+                stale |= self._by_table.get(table, set())
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "coalesced": self.coalesced,
+            "refreshes": self.refreshes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "disk_hits": self.disk.hits if self.disk else 0,
+            "disk_misses": self.disk.misses if self.disk else 0,
+            "disk_rejected": self.disk.rejected if self.disk else 0,
+        }
+
+@transactional_module.on_commit
+def invalidate_tables(tables):
+    for cache in list(caches):
+        cache.invalidate_tables(tables)
+
+query_cache = QueryCache()
+
+def call_key(args, kwargs):
+    # args excludes the connection; returns (query, cache key)
+    if 'query' in kwargs:
+        query = kwargs['query']
+        params = {k: v for k, v in kwargs.items() if k != 'query'}
+        return query, cache_key(query, args, params)
+    query = args[0] if args else ''
+    return query, cache_key(query, args[1:], kwargs)
+
+def refresher(func, conn, *args, **kwargs):
+    # A refresh outlives the call that started it and that call's
+    # connection, so it checks out a connection of its own
+    if isinstance(conn, pool_module.CONNECTION_TYPES):
+        return functools.partial(with_db_connection(func), *args, **kwargs)
+    return functools.partial(func, conn, *args, **kwargs)
+
+def forget_task(store, key, task):
+    if store.tasks.get(key, (None,))[0] is task:
+        del store.tasks[key]
+    # Nobody may be left awaiting a failed load; don't warn about it
+    if not task.cancelled():
+        task.exception()
+
+def async_cache_query(func, cache, ttl, stale):
+    @functools.wraps(func)
+    async def wrapper(conn, *args, **kwargs):
+        store = query_cache if cache is None else cache
+        query, key = call_key(args, kwargs)
+        loop = asyncio.get_running_loop()
+        entry = store.get(key, stale=stale)
+        if entry is not None:
+            print("Returning cached result.")
+            if entry[1] <= time.monotonic() and key not in store.tasks:
+                store.refreshes += 1
+                load = refresher(func, conn, *args, **kwargs)
+            else:
+                return entry[0]
+        else:
+            load = functools.partial(func, conn, *args, **kwargs)
+        tables = read_tables(query)
+        snapshot = store.snapshot(tables)
+        task, started = store.tasks.get(key, (None, None))
+        if task is None or task.get_loop() is not loop or started != snapshot:
+            async def run():
+                found = store.from_disk(key, tables, snapshot)
+                if found is not None:
+                    return found[0]
+                versions = store.disk_versions(tables)
+                result = await load()
+                store.set(key, result, ttl, tables, snapshot)
+                store.to_disk(key, result, ttl, tables, versions)
+                return result
+
+            task = loop.create_task(run())
+            store.tasks[key] = (task, snapshot)
+            task.add_done_callback(lambda t: forget_task(store, key, t))
+        if entry is not None:
+            return entry[0]
+        # Concurrent misses on this loop await the same load; shielded
+        # so one caller being cancelled doesn't fail the others
+        return await asyncio.shield(task)
     return wrapper
 
-def cache_query(func):
+def cache_query(func=None, *, cache=None, ttl=None, stale=0):
+    # stale: seconds past the TTL an entry is still served while one
+    # refresh per key runs in the background
+    if func is None:
+        return lambda f: cache_query(f, cache=cache, ttl=ttl, stale=stale)
+    if inspect.iscoroutinefunction(func):
+        return async_cache_query(func, cache, ttl, stale)
+
     @functools.wraps(func)
     def wrapper(conn, *args, **kwargs):
-        query = kwargs.get('query') or (args[0] if args else '')
-        if query in query_cache:
+        store = query_cache if cache is None else cache
+        query, key = call_key(args, kwargs)
+        entry = store.get(key, stale=stale)
+        if entry is not None:
             print("Returning cached result.")
-            return query_cache[query]
-        result = func(conn, *args, **kwargs)
-        query_cache[query] = result
-        return result
+            if entry[1] <= time.monotonic():
+                store.refresh(key, refresher(func, conn, *args, **kwargs),
+                              ttl, read_tables(query))
+            return entry[0]
+        return store.load(key, functools.partial(func, conn, *args, **kwargs),
+                          ttl, read_tables(query))
     return wrapper
 
 @with_db_connection
@@ -33,9 +494,10 @@ def fetch_users_with_cache(conn, query):
     cursor.execute(query)
     return cursor.fetchall()
 
-# First call: caches result
-users = fetch_users_with_cache(query="SELECT * FROM users")
+if __name__ == "__main__":
+    # First call: caches result
+    users = fetch_users_with_cache(query="SELECT * FROM users")
 
-# Second call: uses cache
-users_again = fetch_users_with_cache(query="SELECT * FROM users")
-print(users_again)
+    # Second call: uses cache
+    users_again = fetch_users_with_cache(query="SELECT * FROM users")
+    print(users_again)
@@ -0,0 +1,224 @@
+import re
+import json
+import math
+import time
+import inspect
+import sqlite3
+import functools
+import threading
+
+pool_module = __import__('1-with_db_connection')
+get_pool = pool_module.get_pool
+CONNECTION_TYPES = pool_module.CONNECTION_TYPES
+
+# Buckets grow by 10%, so percentiles are accurate to within that
+BUCKET_BASE = 1.1
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LISTS = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+
+def normalize_query(query):
+    # Queries differing only in literal values share one histogram
+    query = LITERALS.sub('?', query)
+    query = IN_LISTS.sub('IN (?)', query)
+    return " ".join(query.split())
+
+class QueryStats:
+    def __init__(self):
+        self.calls = 0
+        self.rows = 0
+        self.total_us = 0.0
+        self.max_us = 0.0
+        self.buckets = {}
+        self.plan = None
+
+    def add(self, us, rows):
+        self.calls += 1
+        self.rows += rows
+        self.total_us += us
+        self.max_us = max(self.max_us, us)
+        bucket = int(math.log(max(us, 1.0), BUCKET_BASE))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, p):
+        rank = math.ceil(self.calls * p / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(BUCKET_BASE ** (bucket + 1), self.max_us)
+        return self.max_us
+
+    def summary(self):
+        return {
+            "calls": self.calls,
+            "rows": self.rows,
+            "mean_us": round(self.total_us / self.calls, 1),
+            "p50_us": round(self.percentile(50), 1),
+            "p95_us": round(self.percentile(95), 1),
+            "p99_us": round(self.percentile(99), 1),
+            "max_us": round(self.max_us, 1),
+            "plan": self.plan,
+        }
+
+class QueryProfiler:
+    def __init__(self, slow_ms=100.0):
+        self.slow_ms = slow_ms
+        self.queries = {}
+        self._lock = threading.Lock()
+        self._active = threading.local()
+
+    def enter(self, key):
+        # A query already being timed further up this thread's stack is not
+        # counted again, so stacked profile decorators compose
+        active = self._active.__dict__.setdefault('keys', set())
+        if key in active:
+            return False
+        active.add(key)
+        return True
+
+    def leave(self, key):
+        self._active.keys.discard(key)
+
+    def record(self, key, us, rows):
+        with self._lock:
+            stats = self.queries.get(key)
+            if stats is None:
+                stats = self.queries[key] = QueryStats()
+            stats.add(us, rows)
+            return stats
+
+    def capture_plan(self, stats, query, params, conn=None):
+        try:
+            if conn is not None:
+                plan = conn.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+            else:
+                pool = get_pool()
+                pooled = pool.acquire()
+                try:
+                    plan = pooled.execute("EXPLAIN QUERY PLAN " + query,
+                                          params).fetchall()
+                finally:
+                    pool.release(pooled)
+            stats.plan = [row[-1] for row in plan]
+        except sqlite3.Error as e:
+            stats.plan = [f"EXPLAIN failed: {e}"]
+
+    async def capture_plan_async(self, stats, query, params, conn=None):
+        # On the call's own aiosqlite connection, so the event loop never
+        # blocks on the sync pool and the plan is for the same database
+        if isinstance(conn, sqlite3.Connection):
+            return self.capture_plan(stats, query, params, conn)
+        try:
+            if conn is not None:
+                async with conn.execute("EXPLAIN QUERY PLAN " + query,
+                                        params) as cursor:
+                    plan = await cursor.fetchall()
+            else:
+                async with pool_module.aiosqlite.connect(pool_module.DB_PATH,
+                                                         timeout=5.0) as own:
+                    async with own.execute("EXPLAIN QUERY PLAN " + query,
+                                           params) as cursor:
+                        plan = await cursor.fetchall()
+            stats.plan = [row[-1] for row in plan]
+        except sqlite3.Error as e:
+            stats.plan = [f"EXPLAIN failed: {e}"]
+
+    def report(self):
+        with self._lock:
+            return {key: stats.summary() for key, stats in self.queries.items()}
+
+    def dump(self, format='text'):
+        report = self.report()
+        if format == 'json':
+            return json.dumps(report, indent=2)
+        ranked = sorted(report.items(), key=lambda kv: kv[1]['p99_us'], reverse=True)
+        lines = [f"{'calls':>8} {'rows':>8} {'p50 us':>10} {'p95 us':>10} "
+                 f"{'p99 us':>10}  query"]
+        for key, s in ranked:
+            lines.append(f"{s['calls']:>8} {s['rows']:>8} {s['p50_us']:>10.1f} "
+                         f"{s['p95_us']:>10.1f} {s['p99_us']:>10.1f}  {key}")
+            for step in s['plan'] or ():
+                lines.append(f"{'':>50}  plan: {step}")
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._lock:
+            self.queries.clear()
+
+query_profiler = QueryProfiler()
+
+def row_count(result):
+    if isinstance(result, list):
+        return len(result)
+    return 0 if result is None else 1
+
+def split_call(args, kwargs):
+    # (connection, query, params) following the other decorators' conventions
+    conn = args[0] if args and isinstance(args[0], CONNECTION_TYPES) else None
+    rest = args[1:] if conn is not None else args
+    if 'query' in kwargs:
+        return conn, kwargs['query'], tuple(rest)
+    if rest and isinstance(rest[0], str):
+        return conn, rest[0], tuple(rest[1:])
+    return conn, None, tuple(rest)
+
+def profile_queries(func=None, *, profiler=None, query=None):
+    if func is None:
+        return lambda f: profile_queries(f, profiler=profiler, query=query)
+    if getattr(func, '__profiled__', False):
+        return func
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            prof = query_profiler if profiler is None else profiler
+            conn, sql, params = split_call(args, kwargs)
+            sql = query or sql
+            if sql is None:
+                return await func(*args, **kwargs)
+            key = normalize_query(sql)
+            start = time.perf_counter()
+            result = await func(*args, **kwargs)
+            us = (time.perf_counter() - start) * 1e6
+            stats = prof.record(key, us, row_count(result))
+            if us >= prof.slow_ms * 1000 and stats.plan is None:
+                # Once per query shape
+                await prof.capture_plan_async(stats, sql, params, conn)
+            return result
+        wrapper.__profiled__ = True
+        return wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        prof = query_profiler if profiler is None else profiler
+        conn, sql, params = split_call(args, kwargs)
+        sql = query or sql
+        if sql is None:
+            return func(*args, **kwargs)
+        key = normalize_query(sql)
+        if not prof.enter(key):
+            return func(*args, **kwargs)
+        try:
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            us = (time.perf_counter() - start) * 1e6
+        finally:
+            prof.leave(key)
+        stats = prof.record(key, us, row_count(result))
+        if us >= prof.slow_ms * 1000 and stats.plan is None:
+            prof.capture_plan(stats, sql, params, conn)
+        return result
+    wrapper.__profiled__ = True
+    return wrapper
+
+if __name__ == "__main__":
+    with_db_connection = __import__('1-with_db_connection').with_db_connection
+
+    @with_db_connection
+    @profile_queries
+    def fetch_users(conn, query, *params):
+        return conn.execute_cached(query, params).fetchall()
+
+    for age in (20, 30, 40):
+        fetch_users("SELECT * FROM users WHERE age > ?", age)
+    print(query_profiler.dump())
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the query decorators.
+
+Each bench_* function prints its own report; run the module to execute
+all of them. Database benchmarks build their own users.db in a
+temporary directory.
+"""
+import asyncio
+import contextlib
+import functools
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+
+log_module = __import__("0-log_queries")
+pool_module = __import__("1-with_db_connection")
+retry_module = __import__("3-retry_on_failure")
+cache_module = __import__("4-cache_query")
+transactional_module = __import__("2-transactional")
+
+
+@contextlib.contextmanager
+def users_db(rows=10_000):
+    # The decorators open "users.db" relative to the working directory
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        conn = sqlite3.connect("users.db")
+        conn.execute(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, "
+            "email TEXT, age INTEGER)"
+        )
+        conn.executemany(
+            "INSERT INTO users VALUES (?, ?, ?, ?)",
+            [(i, f"User {i}", f"user{i}@example.com", 18 + i % 60)
+             for i in range(1, rows + 1)],
+        )
+        conn.commit()
+        conn.close()
+        try:
+            yield
+        finally:
+            pool_module.close_pools()
+            os.chdir(cwd)
+
+
+def connect_per_call(func):
+    # with_db_connection as it was before pooling
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        conn = sqlite3.connect("users.db")
+        try:
+            return func(conn, *args, **kwargs)
+        finally:
+            conn.close()
+    return wrapper
+
+
+def per_call_us(fn, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def bench_cache_lookup(calls=200_000):
+    query = "SELECT * FROM users WHERE id = ?"
+    cache = cache_module.QueryCache()
+    key = cache_module.cache_key(query, (1,))
+    cache.set(key, [(1, "Alice", "alice@example.com")])
+
+    @cache_module.cache_query(cache=cache)
+    def fetch(conn, query, user_id):
+        return [(user_id, "Alice", "alice@example.com")]
+
+    print(f"cache lookup overhead over {calls} calls")
+    cases = [
+        ("cache_key", lambda: cache_module.cache_key(query, (1,))),
+        ("get (hit)", lambda: cache.get(key)),
+        ("get (miss)", lambda: cache.get("missing")),
+        ("decorated hit", lambda: fetch(None, query, 1)),
+    ]
+    with contextlib.redirect_stdout(io.StringIO()):
+        timings = [(name, per_call_us(fn, calls)) for name, fn in cases]
+    for name, us in timings:
+        print(f"{name:>16} {us:>8.2f} us")
+
+
+def bench_cache_memory(queries=100_000, max_bytes=8 * 1024 * 1024):
+    cache = cache_module.QueryCache(max_entries=100_000, max_bytes=max_bytes)
+
+    @cache_module.cache_query(cache=cache)
+    def fetch(conn, query):
+        return [(i, f"user{i}", f"user{i}@example.com") for i in range(20)]
+
+    tracemalloc.start()
+    for i in range(queries):
+        fetch(None, f"SELECT * FROM users WHERE id = {i}")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{queries} unique queries: {len(cache)} entries, "
+        f"{cache.bytes / 2**20:.1f} MB accounted (limit {max_bytes / 2**20:.0f} MB), "
+        f"traced peak {peak / 2**20:.1f} MB, {cache.evictions} evictions"
+    )
+
+
+def bench_with_db_connection(calls=20_000):
+    def get_user_by_id(conn, user_id):
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+        return cursor.fetchone()
+
+    with users_db():
+        print(f"get_user_by_id, {calls} calls")
+        for name, decorator in [("connect per call", connect_per_call),
+                                ("pooled", pool_module.with_db_connection)]:
+            fetch = decorator(get_user_by_id)
+            us = per_call_us(lambda: fetch(42), calls)
+            print(f"{name:>18} {1e6 / us:>10,.0f} calls/s")
+
+
+def bench_statement_cache(lookups=100_000):
+    # sqlite3's per-connection statement cache on and off; pooling is what
+    # lets it pay off, since a connection per call starts with it empty
+    def get_user_by_id(conn, user_id):
+        return conn.execute_cached(
+            "SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+
+    size = pool_module.STATEMENT_CACHE_SIZE
+    print(f"get_user_by_id point lookups, {lookups} calls")
+    try:
+        for name, pool_module.STATEMENT_CACHE_SIZE in [("no statement cache", 0),
+                                                       ("statement cache", size)]:
+            with users_db():
+                fetch = pool_module.with_db_connection(get_user_by_id)
+                us = per_call_us(lambda: fetch(42), lookups)
+                print(f"{name:>18} {us:>8.2f} us/call")
+    finally:
+        pool_module.STATEMENT_CACHE_SIZE = size
+
+
+def bench_log_queries(calls=200_000):
+    def fetch(query):
+        return [(1, "Alice")]
+
+    def print_logged(func):
+        # log_queries as it was: strftime and a blocking print per call
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            query = kwargs.get("query") or (args[0] if args else "")
+            timestamp = log_module.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            print(f"[{timestamp}] Executing SQL Query: {query}")
+            return func(*args, **kwargs)
+        return wrapper
+
+    query = "SELECT * FROM users"
+    with open(os.devnull, "w") as devnull:
+        bare = per_call_us(lambda: fetch(query), calls)
+        print(f"log_queries hot-path overhead, {calls} calls")
+        printed = print_logged(fetch)
+        with contextlib.redirect_stdout(devnull):
+            old = per_call_us(lambda: printed(query), calls)
+        print(f"{'print per call':>18} {old - bare:>8.2f} us")
+        for sample in (1, 10):
+            logger = log_module.QueryLogger(stream=devnull, sample=sample)
+            logged = log_module.log_queries(fetch, logger=logger)
+            us = per_call_us(lambda: logged(query), calls)
+            logger.close()
+            print(f"{f'queued 1/{sample}':>18} {us - bare:>8.2f} us")
+
+
+def fixed_delay_retry(retries=3, delay=2):
+    # retry_on_failure as it was: any error, same fixed sleep every time
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(retries):
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    time.sleep(delay)
+            raise Exception("All retry attempts failed.")
+        return wrapper
+    return decorator
+
+
+def bench_retry_contention(threads=16, writes=100, retries=5, delay=0.01):
+    # busy_timeout=0 surfaces every lock conflict to the retry layer
+    def bump(conn, user_id):
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("UPDATE users SET age = age + 1 WHERE id = ?", (user_id,))
+        time.sleep(0.0005)
+        conn.commit()
+
+    variants = [
+        ("fixed delay", fixed_delay_retry(retries, delay)),
+        ("jittered backoff", retry_module.retry_on_failure(retries, delay)),
+    ]
+    print(f"{threads} writers x {writes} transactions under lock contention")
+    for name, retry in variants:
+        with users_db():
+            pool_module.get_pool(max_size=threads, busy_timeout=0)
+            write = retry(pool_module.with_db_connection(bump))
+            failures = []
+
+            def worker(n):
+                for i in range(writes):
+                    try:
+                        write(n * writes + i % 100 + 1)
+                    except Exception as e:
+                        failures.append(e)
+
+            workers = [threading.Thread(target=worker, args=(n,))
+                       for n in range(threads)]
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for thread in workers:
+                    thread.start()
+                for thread in workers:
+                    thread.join()
+            elapsed = time.perf_counter() - start
+        done = threads * writes - len(failures)
+        print(f"{name:>18} {done / elapsed:>8,.0f} tx/s, {len(failures)} failed")
+
+
+def bench_group_commit(threads=32, updates=100):
+    def set_email(conn, user_id, email):
+        conn.execute("UPDATE users SET email = ? WHERE id = ?", (email, user_id))
+
+    print(f"{threads} threads x {updates} update_user_email calls, WAL")
+    for synchronous in ("NORMAL", "FULL"):
+        variants = [
+            ("per-call commit", None),
+            ("group commit", transactional_module.GroupCommit()),
+        ]
+        for name, group in variants:
+            with users_db():
+                pragmas = pool_module.PRAGMAS + (f"PRAGMA synchronous={synchronous}",)
+                # More writers than pooled connections, as under real load
+                pool_module.get_pool(pragmas=pragmas)
+                update = pool_module.with_db_connection(
+                    transactional_module.transactional(set_email, group=group))
+
+                def worker(n):
+                    for i in range(updates):
+                        update(n * updates + i % 100 + 1, f"user{n}-{i}@example.com")
+
+                workers = [threading.Thread(target=worker, args=(n,))
+                           for n in range(threads)]
+                start = time.perf_counter()
+                for thread in workers:
+                    thread.start()
+                for thread in workers:
+                    thread.join()
+                elapsed = time.perf_counter() - start
+            commits = threads * updates if group is None else group.batches
+            print(f"{name:>18} synchronous={synchronous:<6} "
+                  f"{threads * updates / elapsed:>8,.0f} updates/s, {commits} commits")
+
+
+def bench_cold_start(queries=5_000):
+    # First pass after a restart over a workload the previous run cached
+    def fetch_user(conn, query, user_id):
+        return conn.execute(query, (user_id,)).fetchall()
+
+    query = "SELECT * FROM users WHERE age > 30 AND id % 1000 = ?"
+    with users_db(rows=100_000):
+        warm = cache_module.QueryCache(disk=cache_module.DiskCache("query_cache.db"))
+        fetch = pool_module.with_db_connection(
+            cache_module.cache_query(fetch_user, cache=warm))
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(queries):
+                fetch(query, i % 1000)
+        warm.disk.close()
+        print(f"cold start, {queries} calls over 1000 distinct queries")
+        for name, disk in [("memory only", None),
+                           ("memory + disk", cache_module.DiskCache("query_cache.db"))]:
+            cold = cache_module.QueryCache(disk=disk)
+            fetch = pool_module.with_db_connection(
+                cache_module.cache_query(fetch_user, cache=cold))
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for i in range(queries):
+                    fetch(query, i % 1000)
+            elapsed = time.perf_counter() - start
+            stats = cold.stats()
+            served = stats["hits"] + stats["disk_hits"]
+            print(f"{name:>18} {served / queries:>6.1%} hit rate "
+                  f"({stats['disk_hits']} from disk), {elapsed * 1000:>8.1f} ms")
+            if disk is not None:
+                disk.close()
+
+
+def bench_async_fanout(callers=200):
+    # Many tasks asking for the same rows at once, as gathered fetchers do
+    async def fetch_users(conn, query):
+        executions.append(query)
+        async with conn.execute(query) as cursor:
+            return await cursor.fetchall()
+
+    variants = [
+        ("uncached", pool_module.with_db_connection(fetch_users)),
+        ("single-flight", pool_module.with_db_connection(
+            cache_module.cache_query(fetch_users, cache=cache_module.QueryCache()))),
+    ]
+
+    async def fan_out(fetch):
+        await asyncio.gather(*(fetch("SELECT * FROM users") for _ in range(callers)))
+
+    with users_db():
+        print(f"{callers} concurrent async callers, one query")
+        for name, fetch in variants:
+            executions = []
+            start = time.perf_counter()
+            asyncio.run(fan_out(fetch))
+            elapsed = time.perf_counter() - start
+            print(f"{name:>18} {elapsed * 1000:>8.1f} ms, "
+                  f"{len(executions)} executions")
+
+
+if __name__ == "__main__":
+    bench_cache_lookup()
+    bench_cache_memory()
+    bench_with_db_connection()
+    bench_statement_cache()
+    bench_log_queries()
+    bench_retry_contention()
+    bench_group_commit()
+    bench_cold_start()
+    bench_async_fanout()
@@ -0,0 +1,920 @@
+#!/usr/bin/env python3
+"""
+Unittests for the query decorators.
+"""
+
+import asyncio
+import inspect
+import io
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import redirect_stdout
+
+log_module = __import__("0-log_queries")
+pool_module = __import__("1-with_db_connection")
+cache_module = __import__("4-cache_query")
+profile_module = __import__("5-profile_queries")
+retry_module = __import__("3-retry_on_failure")
+transactional_module = __import__("2-transactional")
+QueryCache = cache_module.QueryCache
+
+
+class UsersDbTestCase(unittest.TestCase):
+    """
+    Base case running inside a temporary directory holding users.db.
+    """
+
+    users = 8
+
+    def setUp(self) -> None:
+        """Create users.db in a fresh working directory."""
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        conn = sqlite3.connect("users.db")
+        conn.execute(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, "
+            "email TEXT, age INTEGER)")
+        conn.executemany(
+            "INSERT INTO users VALUES (?, ?, ?, ?)",
+            [(i, f"User {i}", f"user{i}@example.com", 20 + i)
+             for i in range(1, self.users + 1)])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self) -> None:
+        """Leave and remove the working directory."""
+        pool_module.close_pools()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+
+class TestQueryCache(unittest.TestCase):
+    """
+    Tests for 4-cache_query.QueryCache and cache_query.
+    """
+
+    def test_lru_eviction_by_entry_count(self) -> None:
+        """Test the least recently used entry is evicted first."""
+        cache = QueryCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_eviction_by_bytes(self) -> None:
+        """Test the byte budget is never exceeded."""
+        cache = QueryCache(max_entries=1000, max_bytes=10_000)
+        for i in range(100):
+            cache.set(i, [(i, "x" * 500)])
+            self.assertLessEqual(cache.bytes, 10_000)
+        self.assertLess(len(cache), 100)
+
+    def test_ttl_expiry(self) -> None:
+        """Test an expired entry is a miss."""
+        cache = QueryCache(ttl=0)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_key_includes_normalized_parameters(self) -> None:
+        """Test keys ignore whitespace but not parameter values."""
+        key = cache_module.cache_key
+        self.assertEqual(key("SELECT *\n  FROM users", (1,)),
+                         key("SELECT * FROM users", [1]))
+        self.assertNotEqual(key("SELECT * FROM users WHERE id = ?", (1,)),
+                            key("SELECT * FROM users WHERE id = ?", (2,)))
+
+    def test_decorator_counts_hits_and_misses(self) -> None:
+        """Test cache_query serves repeats from the cache."""
+        cache = QueryCache()
+        calls = []
+
+        @cache_module.cache_query(cache=cache)
+        def fetch(conn, query, *params):
+            calls.append((query, params))
+            return [params]
+
+        with redirect_stdout(io.StringIO()):
+            fetch(None, "SELECT ?", 1)
+            fetch(None, "SELECT ?", 1)
+            fetch(None, query="SELECT ?")
+            fetch(None, "SELECT ?", 2)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+    def test_memory_bound_under_unique_queries(self) -> None:
+        """Test a stream of unique queries stays within both limits."""
+        cache = QueryCache(max_entries=500, max_bytes=200_000)
+
+        @cache_module.cache_query(cache=cache)
+        def fetch(conn, query):
+            return [(i, "user") for i in range(10)]
+
+        for i in range(20_000):
+            fetch(None, f"SELECT * FROM users WHERE id = {i}")
+            self.assertLessEqual(len(cache), 500)
+            self.assertLessEqual(cache.bytes, 200_000)
+        self.assertEqual(cache.misses, 20_000)
+        self.assertEqual(cache.evictions, 20_000 - len(cache))
+
+
+class TestCacheInvalidation(UsersDbTestCase):
+    """
+    Tests for table-aware invalidation driven by transactional commits.
+    """
+
+    def test_tables_parsed_from_sql(self) -> None:
+        """Test read and written tables are extracted from SQL."""
+        self.assertEqual(
+            cache_module.read_tables(
+                "SELECT * FROM users u JOIN orders o ON o.user_id = u.id"),
+            {"users", "orders"})
+        self.assertEqual(cache_module.read_tables("SELECT 1"),
+                         {cache_module.ALL_TABLES})
+        self.assertEqual(
+            transactional_module.written_tables(
+                "INSERT OR REPLACE INTO \"Users\" VALUES (1)"),
+            {"users"})
+
+    def test_commit_drops_only_entries_for_written_tables(self) -> None:
+        """Test a write to one table keeps entries for other tables."""
+        cache = QueryCache()
+        cache.set("users", 1, tables=frozenset(["users"]))
+        cache.set("posts", 2, tables=frozenset(["posts"]))
+
+        @transactional_module.with_db_connection
+        @transactional_module.transactional
+        def rename(conn):
+            conn.execute("UPDATE users SET name = 'x' WHERE id = 1")
+
+        rename()
+        self.assertNotIn("users", cache)
+        self.assertIn("posts", cache)
+
+    def test_rolled_back_write_keeps_entries(self) -> None:
+        """Test a failed transaction does not touch cached rows it never wrote."""
+        cache = QueryCache()
+        cache.set("posts", 2, tables=frozenset(["posts"]))
+
+        @transactional_module.with_db_connection
+        @transactional_module.transactional
+        def fail(conn):
+            conn.execute("SELECT * FROM users")
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            fail()
+        self.assertIn("posts", cache)
+
+    def test_mixed_writers_and_cached_readers(self) -> None:
+        """Test writers always read their own committed email back."""
+        cache = QueryCache()
+        query = "SELECT email FROM users WHERE id = ?"
+
+        @transactional_module.with_db_connection
+        @transactional_module.transactional
+        def set_email(conn, user_id, email):
+            conn.execute("UPDATE users SET email = ? WHERE id = ?",
+                         (email, user_id))
+
+        @cache_module.with_db_connection
+        @cache_module.cache_query(cache=cache)
+        def get_email(conn, query, user_id):
+            return conn.execute(query, (user_id,)).fetchone()[0]
+
+        stop = threading.Event()
+        failures = []
+
+        def writer(user_id):
+            try:
+                for n in range(40):
+                    email = f"user{user_id}-{n}@example.com"
+                    set_email(user_id, email)
+                    seen = get_email(query, user_id)
+                    if seen != email:
+                        failures.append((user_id, email, seen))
+            except Exception as e:
+                failures.append(e)
+
+        def reader():
+            while not stop.is_set():
+                get_email(query, random.randint(1, self.users))
+
+        writers = [threading.Thread(target=writer, args=(i,))
+                   for i in range(1, 5)]
+        readers = [threading.Thread(target=reader) for _ in range(4)]
+        with redirect_stdout(io.StringIO()):
+            for thread in readers + writers:
+                thread.start()
+            for thread in writers:
+                thread.join()
+            stop.set()
+            for thread in readers:
+                thread.join()
+        self.assertEqual(failures, [])
+        self.assertGreater(cache.hits, 0)
+        self.assertGreater(cache.invalidations, 0)
+
+
+class TestGroupCommit(UsersDbTestCase):
+    """
+    Tests for transactional(group=...) batching.
+    """
+
+    def run_together(self, calls):
+        """Start every call at once; return each one's result or error."""
+        start = threading.Barrier(len(calls))
+        outcomes = [None] * len(calls)
+
+        def worker(i, call):
+            start.wait()
+            try:
+                outcomes[i] = call()
+            except Exception as e:
+                outcomes[i] = e
+
+        threads = [threading.Thread(target=worker, args=(i, call))
+                   for i, call in enumerate(calls)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def emails(self):
+        """Read every user's email straight from the file."""
+        conn = sqlite3.connect("users.db")
+        rows = dict(conn.execute("SELECT id, email FROM users"))
+        conn.close()
+        return rows
+
+    def test_concurrent_calls_share_one_commit(self) -> None:
+        """Test calls inside the window commit as one batch."""
+        group = transactional_module.GroupCommit(window=0.5, max_ops=4)
+
+        @pool_module.with_db_connection
+        @transactional_module.transactional(group=group)
+        def set_email(conn, user_id, email):
+            conn.execute("UPDATE users SET email = ? WHERE id = ?",
+                         (email, user_id))
+            return user_id
+
+        outcomes = self.run_together(
+            [lambda i=i: set_email(i, f"new{i}@example.com") for i in range(1, 5)])
+        self.assertEqual(sorted(outcomes), [1, 2, 3, 4])
+        self.assertEqual((group.batches, group.members), (1, 4))
+        emails = self.emails()
+        self.assertEqual([emails[i] for i in range(1, 5)],
+                         [f"new{i}@example.com" for i in range(1, 5)])
+
+    def test_batch_grows_past_the_pool_size(self) -> None:
+        """Test waiting members hold no pooled connection."""
+        group = transactional_module.GroupCommit(window=0.3)
+
+        @pool_module.with_db_connection
+        @transactional_module.transactional(group=group)
+        def set_email(conn, user_id, email):
+            conn.execute("UPDATE users SET email = ? WHERE id = ?",
+                         (email, user_id))
+
+        pool = pool_module.get_pool()
+        outcomes = self.run_together(
+            [lambda i=i: set_email(i % 4 + 1, f"new{i}@example.com")
+             for i in range(32)])
+        self.assertEqual(outcomes, [None] * 32)
+        self.assertGreater(32, pool.max_size)
+        self.assertLessEqual(group.batches, 2)
+        self.assertEqual(group.members, 32)
+        self.assertLessEqual(pool.stats()["open"], 2)
+
+    def test_failed_member_is_rolled_back_alone(self) -> None:
+        """Test one member's error undoes only its own writes."""
+        group = transactional_module.GroupCommit(window=0.5, max_ops=3)
+
+        @pool_module.with_db_connection
+        @transactional_module.transactional(group=group)
+        def set_email(conn, user_id, email):
+            conn.execute("UPDATE users SET email = ? WHERE id = ?",
+                         (email, user_id))
+            if user_id == 2:
+                raise ValueError("rejected")
+
+        outcomes = self.run_together(
+            [lambda i=i: set_email(i, f"new{i}@example.com") for i in range(1, 4)])
+        self.assertIsNone(outcomes[0])
+        self.assertIsInstance(outcomes[1], ValueError)
+        self.assertIsNone(outcomes[2])
+        self.assertEqual(group.batches, 1)
+        emails = self.emails()
+        self.assertEqual(emails[1], "new1@example.com")
+        self.assertEqual(emails[2], "user2@example.com")
+        self.assertEqual(emails[3], "new3@example.com")
+
+    def test_commit_invalidates_cached_reads(self) -> None:
+        """Test a grouped commit still notifies the query caches."""
+        cache = QueryCache()
+        cache.set("k", [1], tables=frozenset(["users"]))
+
+        @pool_module.with_db_connection
+        @transactional_module.transactional(
+            group=transactional_module.GroupCommit(window=0))
+        def set_email(conn, user_id, email):
+            conn.execute("UPDATE users SET email = ? WHERE id = ?",
+                         (email, user_id))
+
+        set_email(1, "solo@example.com")
+        self.assertNotIn("k", cache)
+        self.assertEqual(self.emails()[1], "solo@example.com")
+
+
+class TestSingleFlight(UsersDbTestCase):
+    """
+    Tests for request coalescing and stale-while-revalidate.
+    """
+
+    def test_concurrent_misses_run_query_once(self) -> None:
+        """Test 64 threads missing on one key cause a single execution."""
+        cache = QueryCache()
+        executions = []
+        start = threading.Barrier(64)
+
+        @pool_module.with_db_connection
+        @cache_module.cache_query(cache=cache)
+        def fetch_users(conn, query):
+            executions.append(query)
+            time.sleep(0.05)
+            return conn.execute(query).fetchall()
+
+        results = []
+
+        def worker():
+            start.wait()
+            results.append(fetch_users(query="SELECT * FROM users"))
+
+        threads = [threading.Thread(target=worker) for _ in range(64)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(executions), 1)
+        self.assertEqual(len(results), 64)
+        self.assertTrue(all(rows == results[0] for rows in results))
+        self.assertGreater(cache.coalesced, 0)
+        self.assertEqual(cache.flights, {})
+
+    def test_waiters_share_the_leader_error(self) -> None:
+        """Test a failed load raises in every waiting caller."""
+        cache = QueryCache()
+        calls = []
+        start = threading.Barrier(8)
+
+        @cache_module.cache_query(cache=cache)
+        def broken(conn, query):
+            calls.append(query)
+            time.sleep(0.05)
+            raise sqlite3.OperationalError("no such table: nope")
+
+        errors = []
+
+        def worker():
+            start.wait()
+            try:
+                broken(None, "SELECT * FROM nope")
+            except sqlite3.OperationalError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((len(calls), len(errors)), (1, 8))
+        self.assertNotIn(cache_module.cache_key("SELECT * FROM nope"), cache)
+
+    def test_stale_value_served_while_refreshing(self) -> None:
+        """Test an expired entry is returned at once and refreshed behind."""
+        cache = QueryCache()
+        version = [1]
+        release = threading.Event()
+
+        @cache_module.cache_query(cache=cache, ttl=0.2, stale=60)
+        def fetch(conn, query):
+            if version[0] > 1:
+                release.wait(5)
+            return version[0]
+
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(fetch(None, "SELECT 1"), 1)
+            time.sleep(0.25)
+            version[0] = 2
+            self.assertEqual(fetch(None, "SELECT 1"), 1)
+            self.assertEqual(fetch(None, "SELECT 1"), 1)
+            release.set()
+            for _ in range(100):
+                if not cache.flights:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(fetch(None, "SELECT 1"), 2)
+        self.assertEqual(cache.refreshes, 1)
+        self.assertEqual(cache.stale_hits, 2)
+
+
+class TestDiskCache(UsersDbTestCase):
+    """
+    Tests for the persistent second cache tier.
+    """
+
+    def setUp(self) -> None:
+        """Count query executions across restarts."""
+        super().setUp()
+        self.executions = 0
+        self.disks = []
+
+    def tearDown(self) -> None:
+        """Close every disk tier before the directory goes."""
+        for disk in self.disks:
+            disk.close()
+        super().tearDown()
+
+    def open_disk(self):
+        """Open query_cache.db as a process starting up would."""
+        disk = cache_module.DiskCache("query_cache.db")
+        self.disks.append(disk)
+        return disk
+
+    def restart(self):
+        """Return a cache_query-wrapped fetch backed by a fresh cache."""
+        cache = QueryCache(disk=self.open_disk())
+
+        @pool_module.with_db_connection
+        @cache_module.cache_query(cache=cache)
+        def fetch(conn, query, *params):
+            self.executions += 1
+            return conn.execute(query, params).fetchall()
+
+        return cache, fetch
+
+    def test_results_survive_a_restart(self) -> None:
+        """Test a new cache answers from disk without querying."""
+        query = "SELECT * FROM users WHERE age > ?"
+        _, fetch = self.restart()
+        rows = fetch(query, 24)
+        cache, fetch = self.restart()
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(fetch(query, 24), rows)
+            self.assertEqual(fetch(query, 24), rows)
+        self.assertEqual(self.executions, 1)
+        self.assertEqual(cache.stats()["disk_hits"], 1)
+        self.assertEqual(cache.hits, 1)
+
+    def test_commit_rejects_persisted_entries(self) -> None:
+        """Test entries read before a commit to their table are refused."""
+        query = "SELECT email FROM users WHERE id = ?"
+        _, fetch = self.restart()
+        fetch(query, 1)
+
+        @pool_module.with_db_connection
+        @transactional_module.transactional
+        def set_email(conn, user_id, email):
+            conn.execute("UPDATE users SET email = ? WHERE id = ?",
+                         (email, user_id))
+
+        set_email(1, "moved@example.com")
+        cache, fetch = self.restart()
+        self.assertEqual(fetch(query, 1), [("moved@example.com",)])
+        self.assertEqual(self.executions, 2)
+        self.assertEqual(cache.stats()["disk_rejected"], 1)
+
+    def test_unrelated_commit_keeps_persisted_entries(self) -> None:
+        """Test a write to another table leaves users entries loadable."""
+        query = "SELECT email FROM users WHERE id = ?"
+        _, fetch = self.restart()
+        fetch(query, 1)
+
+        @pool_module.with_db_connection
+        @transactional_module.transactional
+        def add_order(conn, user_id):
+            conn.execute("CREATE TABLE IF NOT EXISTS orders (user_id INTEGER)")
+            conn.execute("INSERT INTO orders VALUES (?)", (user_id,))
+
+        add_order(1)
+        cache, fetch = self.restart()
+        fetch(query, 1)
+        self.assertEqual(self.executions, 1)
+        self.assertEqual(cache.stats()["disk_hits"], 1)
+        self.assertEqual(cache.stats()["disk_rejected"], 0)
+
+    def test_entries_are_kept_per_database(self) -> None:
+        """Test one cache file never serves another database's rows."""
+        first = cache_module.DiskCache("query_cache.db", database="a.db")
+        second = cache_module.DiskCache("query_cache.db", database="b.db")
+        self.disks += [first, second]
+        first.set("key", [("Alice",)], 60, first.versions({"users"}))
+        self.assertIsNone(second.get("key", {"users"}))
+        first.invalidate_tables({"users"})
+        second.set("key", [("Bob",)], 60, second.versions({"users"}))
+        self.assertEqual(second.get("key", {"users"})[0], [("Bob",)])
+        self.assertIsNone(first.get("key", {"users"}))
+
+    def test_unreadable_value_is_rejected(self) -> None:
+        """Test a corrupt blob counts as rejected instead of raising."""
+        disk = self.open_disk()
+        disk.set("key", [1], 60, disk.versions({"users"}))
+        disk._conn.execute("UPDATE entries SET value = ?", (b"\xff\x00",))
+        self.assertIsNone(disk.get("key", {"users"}))
+        self.assertEqual((disk.hits, disk.rejected), (0, 1))
+
+    def test_unmarshalable_values_stay_in_memory(self) -> None:
+        """Test values that aren't plain data are not persisted."""
+        disk = self.open_disk()
+        disk.set("key", [object()], 60, disk.versions({"users"}))
+        self.assertIsNone(disk.get("key", {"users"}))
+
+    def test_expired_entries_are_not_loaded(self) -> None:
+        """Test the TTL carries over to the disk tier."""
+        disk = self.open_disk()
+        disk.set("key", [1], 0.01, disk.versions({"users"}))
+        self.assertIsNotNone(disk.get("key", {"users"}))
+        time.sleep(0.02)
+        self.assertIsNone(disk.get("key", {"users"}))
+
+
+class TestConnectionPool(UsersDbTestCase):
+    """
+    Tests for the pool behind with_db_connection.
+    """
+
+    def test_connection_reused_across_calls(self) -> None:
+        """Test sequential calls share one configured connection."""
+        seen = set()
+
+        @pool_module.with_db_connection
+        def journal_mode(conn):
+            seen.add(id(conn))
+            return conn.execute("PRAGMA journal_mode").fetchone()[0]
+
+        for _ in range(5):
+            self.assertEqual(journal_mode(), "wal")
+        self.assertEqual(len(seen), 1)
+        self.assertEqual(pool_module.get_pool().stats()["open"], 1)
+
+    def test_uncommitted_work_is_rolled_back(self) -> None:
+        """Test a returned connection carries no open transaction."""
+        @pool_module.with_db_connection
+        def rename(conn):
+            conn.execute("UPDATE users SET name = 'x' WHERE id = 1")
+
+        rename()
+        self.assertEqual(pool_module.get_user_by_id(1)[1], "User 1")
+
+    def test_repeated_statements_are_counted(self) -> None:
+        """Test repeated SQL on a pooled connection counts as a hit."""
+        for user_id in (1, 2, 1):
+            self.assertEqual(pool_module.get_user_by_id(user_id)[0], user_id)
+        stats = pool_module.get_pool().stats()
+        self.assertEqual((stats["statement_hits"], stats["statement_misses"]),
+                         (2, 1))
+
+    def test_each_call_gets_its_own_cursor(self) -> None:
+        """Test nesting the same SQL and closing a cursor affect nobody else."""
+        query = "SELECT id FROM users WHERE id <= ?"
+
+        @pool_module.with_db_connection
+        def nested(conn):
+            return [(outer, len(conn.execute_cached(query, (5,)).fetchall()))
+                    for (outer,) in conn.execute_cached(query, (5,))]
+
+        @pool_module.with_db_connection
+        def close_after(conn):
+            cursor = conn.execute_cached(query, (2,))
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+
+        self.assertEqual(nested(), [(i, 5) for i in range(1, 6)])
+        self.assertEqual(close_after(), [(1,), (2,)])
+        self.assertEqual(close_after(), [(1,), (2,)])
+
+    def test_max_size_and_timeout(self) -> None:
+        """Test checkouts beyond max_size wait and then time out."""
+        pool = pool_module.ConnectionPool("users.db", max_size=1)
+        held = pool.acquire()
+        with self.assertRaises(TimeoutError):
+            pool.acquire(timeout=0.05)
+        pool.release(held)
+        self.assertIs(pool.acquire(timeout=0.05), held)
+        pool.close()
+
+    def test_idle_connections_are_reaped(self) -> None:
+        """Test connections idle past idle_timeout are closed."""
+        pool = pool_module.ConnectionPool("users.db", idle_timeout=0)
+        first = pool.acquire()
+        pool.release(first)
+        second = pool.acquire()
+        self.assertIsNot(first, second)
+        self.assertEqual(pool.stats()["reaped"], 1)
+        pool.release(second)
+        pool.close()
+
+
+class TestQueryLogger(unittest.TestCase):
+    """
+    Tests for the background structured logger behind log_queries.
+    """
+
+    def make_logger(self, **options):
+        """Build a logger writing into an in-memory stream."""
+        self.stream = io.StringIO()
+        return log_module.QueryLogger(stream=self.stream, **options)
+
+    def records(self, logger):
+        """Flush the logger and parse what it wrote."""
+        logger.close()
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_records_duration_rows_and_params(self) -> None:
+        """Test each call becomes one JSON record with its measurements."""
+        logger = self.make_logger()
+
+        @log_module.log_queries(logger=logger)
+        def fetch(query, *params):
+            return [(1,), (2,)]
+
+        fetch("SELECT id FROM users WHERE age > ? AND age < ?", 20, 30)
+        fetch(query="SELECT 1")
+        first, second = self.records(logger)
+        self.assertEqual(first["query"],
+                         "SELECT id FROM users WHERE age > ? AND age < ?")
+        self.assertEqual((first["rows"], first["params"]), (2, 2))
+        self.assertEqual((second["rows"], second["params"]), (2, 0))
+        self.assertGreaterEqual(first["duration_us"], 0)
+
+    def test_sampling(self) -> None:
+        """Test only one call in `sample` is logged."""
+        logger = self.make_logger(sample=4)
+        fetch = log_module.log_queries(lambda query: None, logger=logger)
+        for _ in range(20):
+            fetch("SELECT 1")
+        self.assertEqual(len(self.records(logger)), 5)
+
+    def test_failed_query_is_logged_and_raised(self) -> None:
+        """Test an exception is recorded and still propagates."""
+        logger = self.make_logger()
+
+        @log_module.log_queries(logger=logger)
+        def fetch(query):
+            raise ValueError("bad")
+
+        with self.assertRaises(ValueError):
+            fetch("SELEC 1")
+        self.assertEqual(self.records(logger)[0]["error"], "ValueError('bad')")
+
+    def test_unserializable_query_keeps_logger_alive(self) -> None:
+        """Test a connection in the query slot is logged and later calls too."""
+        logger = self.make_logger()
+        fetch = log_module.log_queries(lambda *args: [], logger=logger)
+        conn = sqlite3.connect(":memory:")
+        self.addCleanup(conn.close)
+        fetch(conn, "SELECT 1")
+        fetch({"nested": object()})
+        fetch("SELECT 2")
+        first, second, third = self.records(logger)
+        self.assertIn("sqlite3.Connection", first["query"])
+        self.assertIn("object", second["query"]["nested"])
+        self.assertEqual(third["query"], "SELECT 2")
+
+
+class TestProfileQueries(UsersDbTestCase):
+    """
+    Tests for the per-query latency profiler.
+    """
+
+    def test_literals_share_one_entry(self) -> None:
+        """Test queries differing only in literals are grouped."""
+        normalize = profile_module.normalize_query
+        self.assertEqual(normalize("SELECT * FROM users WHERE id = 7"),
+                         normalize("SELECT *  FROM users WHERE id = 12"))
+        self.assertEqual(normalize("SELECT * FROM users WHERE name IN ('a', 'b')"),
+                         "SELECT * FROM users WHERE name IN (?)")
+
+    def test_stacked_decorators_count_once(self) -> None:
+        """Test profiling outside and inside with_db_connection counts once."""
+        profiler = profile_module.QueryProfiler()
+        profile = profile_module.profile_queries(profiler=profiler)
+
+        @profile
+        @pool_module.with_db_connection
+        @profile
+        def fetch(conn, query, *params):
+            return conn.execute(query, params).fetchall()
+
+        for age in (20, 25, 30):
+            fetch("SELECT * FROM users WHERE age > ?", age)
+        report = profiler.report()
+        stats = report["SELECT * FROM users WHERE age > ?"]
+        self.assertEqual(stats["calls"], 3)
+        self.assertEqual(stats["rows"], 8 + 3 + 0)
+        self.assertLessEqual(stats["p50_us"], stats["p99_us"])
+
+    def test_slow_query_plan_captured(self) -> None:
+        """Test a query over the threshold gets its EXPLAIN QUERY PLAN."""
+        profiler = profile_module.QueryProfiler(slow_ms=0)
+
+        @pool_module.with_db_connection
+        @profile_module.profile_queries(profiler=profiler)
+        def fetch(conn, query, *params):
+            return conn.execute(query, params).fetchall()
+
+        fetch("SELECT * FROM users WHERE id = ?", 3)
+        plan = profiler.report()["SELECT * FROM users WHERE id = ?"]["plan"]
+        self.assertTrue(any("users" in step for step in plan))
+        self.assertIn("plan:", profiler.dump())
+        self.assertIn('"calls": 1', profiler.dump("json"))
+
+    def test_slow_async_query_plan_uses_its_connection(self) -> None:
+        """Test a coroutine's plan comes from its own aiosqlite connection."""
+        profiler = profile_module.QueryProfiler(slow_ms=0)
+
+        @pool_module.with_db_connection
+        @profile_module.profile_queries(profiler=profiler)
+        async def fetch(conn, query, *params):
+            async with conn.execute(query, params) as cursor:
+                return await cursor.fetchall()
+
+        asyncio.run(fetch("SELECT * FROM users WHERE id = ?", 3))
+        plan = profiler.report()["SELECT * FROM users WHERE id = ?"]["plan"]
+        self.assertTrue(any("users" in step for step in plan))
+        self.assertEqual(pool_module.pools, {})
+
+
+class TestRetryOnFailure(UsersDbTestCase):
+    """
+    Tests for jittered, classified retries.
+    """
+
+    def test_no_attempts_is_rejected(self) -> None:
+        """Test retries below 1 fail when the decorator is applied."""
+        for retries in (0, -1):
+            with self.assertRaises(ValueError):
+                retry_module.retry_on_failure(retries=retries)
+
+    def test_transient_error_retried_on_fresh_connection(self) -> None:
+        """Test a locked database is retried with a new connection each time."""
+        seen = []
+
+        @retry_module.retry_on_failure(retries=3, delay=0.001)
+        @pool_module.with_db_connection
+        def flaky(conn):
+            seen.append(conn)
+            if len(seen) < 3:
+                raise sqlite3.OperationalError("database is locked")
+            return "ok"
+
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(flaky(), "ok")
+        self.assertEqual(len({id(conn) for conn in seen}), 3)
+        stats = flaky.retry_stats.summary()
+        self.assertEqual((stats["calls"], stats["retries"]), (1, 2))
+
+    def test_permanent_error_not_retried(self) -> None:
+        """Test a syntax error propagates after a single attempt."""
+        @retry_module.retry_on_failure(retries=5, delay=0.001)
+        @pool_module.with_db_connection
+        def broken(conn):
+            return conn.execute("SELEC * FROM users").fetchall()
+
+        with self.assertRaises(sqlite3.OperationalError):
+            broken()
+        self.assertEqual(broken.retry_stats.summary()["attempts"], 1)
+
+    def test_budget_and_exhaustion(self) -> None:
+        """Test retries stop at the attempt limit or the time budget."""
+        def locked():
+            raise sqlite3.OperationalError("database is locked")
+
+        limited = retry_module.retry_on_failure(retries=3, delay=0.001)(locked)
+        budgeted = retry_module.retry_on_failure(
+            retries=100, delay=10, budget=0.01)(locked)
+        with redirect_stdout(io.StringIO()):
+            with self.assertRaises(retry_module.RetryError):
+                limited()
+            with self.assertRaises(retry_module.RetryError):
+                budgeted()
+        self.assertEqual(limited.retry_stats.summary()["attempts"], 3)
+        self.assertLess(budgeted.retry_stats.summary()["attempts"], 100)
+
+
+class TestAsyncDecorators(UsersDbTestCase):
+    """
+    Tests for the decorators wrapping coroutine functions.
+    """
+
+    def test_full_stack_wraps_coroutines(self) -> None:
+        """Test every decorator yields a coroutine function that works."""
+        stream = io.StringIO()
+        logger = log_module.QueryLogger(stream=stream)
+
+        @log_module.log_queries(logger=logger)
+        @retry_module.retry_on_failure(retries=2, delay=0.001)
+        @pool_module.with_db_connection
+        @cache_module.cache_query(cache=QueryCache())
+        @profile_module.profile_queries(profiler=profile_module.QueryProfiler())
+        async def fetch(conn, query):
+            async with conn.execute(query) as cursor:
+                return await cursor.fetchall()
+
+        self.assertTrue(inspect.iscoroutinefunction(fetch))
+        with redirect_stdout(io.StringIO()):
+            rows = asyncio.run(fetch("SELECT * FROM users WHERE age > 25"))
+        logger.close()
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(json.loads(stream.getvalue())["rows"], 3)
+
+    def test_concurrent_misses_share_one_execution(self) -> None:
+        """Test gathered misses on one key run the query once."""
+        cache = QueryCache()
+        executions = []
+
+        @pool_module.with_db_connection
+        @cache_module.cache_query(cache=cache)
+        async def fetch(conn, query):
+            executions.append(query)
+            async with conn.execute(query) as cursor:
+                return await cursor.fetchall()
+
+        async def main():
+            return await asyncio.gather(
+                *(fetch("SELECT * FROM users") for _ in range(10)))
+
+        results = asyncio.run(main())
+        self.assertEqual(len(executions), 1)
+        self.assertTrue(all(rows == results[0] for rows in results))
+        self.assertEqual(len(results[0]), self.users)
+        self.assertEqual(cache.tasks, {})
+
+    def test_transaction_commits_invalidates_and_rolls_back(self) -> None:
+        """Test async commits notify caches and failures roll back."""
+        cache = QueryCache()
+        cache.set("k", [1], tables=frozenset(["users"]))
+
+        @pool_module.with_db_connection
+        @transactional_module.transactional
+        async def rename(conn, user_id, name, fail=False):
+            await conn.execute(
+                "UPDATE users SET name = ? WHERE id = ?", (name, user_id))
+            if fail:
+                raise ValueError("abort")
+
+        asyncio.run(rename(1, "Renamed"))
+        self.assertNotIn("k", cache)
+        with self.assertRaises(ValueError):
+            asyncio.run(rename(2, "Lost", fail=True))
+        conn = sqlite3.connect("users.db")
+        names = dict(conn.execute("SELECT id, name FROM users WHERE id < 3"))
+        conn.close()
+        self.assertEqual(names, {1: "Renamed", 2: "User 2"})
+
+    def test_retry_backs_off_without_blocking_the_loop(self) -> None:
+        """Test other tasks keep running while a retry waits."""
+        attempts = []
+
+        @retry_module.retry_on_failure(retries=5, delay=0.05, max_delay=0.05)
+        async def flaky():
+            attempts.append(asyncio.get_running_loop().time())
+            if len(attempts) < 3:
+                raise sqlite3.OperationalError("database is locked")
+            return "ok"
+
+        async def main():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.001)
+
+            task = asyncio.create_task(ticker())
+            result = await flaky()
+            task.cancel()
+            return result, ticks
+
+        with redirect_stdout(io.StringIO()):
+            result, ticks = asyncio.run(main())
+        self.assertEqual(result, "ok")
+        self.assertEqual(flaky.retry_stats.summary()["retries"], 2)
+        self.assertGreater(ticks, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
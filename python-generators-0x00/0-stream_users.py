@@ -1,18 +1,25 @@
-import mysql.connector
+db_pool = __import__("db_pool")
 
 
-def stream_users():
-    connection = mysql.connector.connect(
-        host="localhost",
-        user="root",  # update as needed
-        password="",  # update as needed
-        database="ALX_prodev",
-    )
-    cursor = connection.cursor(dictionary=True)
+def stream_users(chunk_size=1000):
+    # Unbuffered cursor: rows stay on the server until fetchmany asks for them
+    pool = db_pool.get_pool()
+    connection = pool.acquire()
+    cursor = connection.cursor(dictionary=True, buffered=False)
+    exhausted = False
     try:
         cursor.execute("SELECT * FROM user_data")
-        for row in cursor:
-            yield row
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                exhausted = True
+                break
+            yield from rows
     finally:
-        cursor.close()
-        connection.close()
+        if exhausted:
+            cursor.close()
+            pool.release(connection)
+        else:
+            # Unread rows are still pending; dropping the connection is
+            # cheaper than draining the rest of the table
+            pool.discard(connection)
@@ -1,21 +1,163 @@
 # 2-lazy_paginate.py
-seed = __import__("seed")
+import base64
+import json
+import queue
+import re
+import threading
+
+db_pool = __import__("db_pool")
+
+SORT_KEY_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
 
 
 def paginate_users(page_size, offset):
-    connection = seed.connect_to_prodev()
-    cursor = connection.cursor(dictionary=True)
-    cursor.execute(f"SELECT * FROM user_data LIMIT {page_size} OFFSET {offset}")
-    rows = cursor.fetchall()
-    connection.close()
+    with db_pool.get_pool().connection() as connection:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(f"SELECT * FROM user_data LIMIT {page_size} OFFSET {offset}")
+        rows = cursor.fetchall()
+        cursor.close()
+    return rows
+
+
+def check_sort_key(sort_key):
+    # The key is interpolated into the SQL, so only plain column names pass
+    if not SORT_KEY_PATTERN.match(sort_key):
+        raise ValueError(f"Invalid sort key: {sort_key!r}")
+    return sort_key
+
+
+def seek_query(sort_key, after):
+    # Non-unique keys are tie-broken on the primary key so no row is skipped
+    if sort_key == "user_id":
+        order = "user_id"
+        where = "WHERE user_id > %s" if after is not None else ""
+    else:
+        order = f"{sort_key}, user_id"
+        where = (
+            f"WHERE {sort_key} > %s OR ({sort_key} = %s AND user_id > %s)"
+            if after is not None
+            else ""
+        )
+    return f"SELECT * FROM user_data {where} ORDER BY {order} LIMIT %s"
+
+
+def seek_params(sort_key, after, page_size):
+    if after is None:
+        return (page_size,)
+    if sort_key == "user_id":
+        return (after[0], page_size)
+    value, user_id = after
+    return (value, value, user_id, page_size)
+
+
+def paginate_users_after(page_size, after=None, sort_key="user_id"):
+    check_sort_key(sort_key)
+    with db_pool.get_pool().connection() as connection:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(
+            seek_query(sort_key, after), seek_params(sort_key, after, page_size)
+        )
+        rows = cursor.fetchall()
+        cursor.close()
     return rows
 
 
-def lazy_pagination(page_size):
-    offset = 0
+def page_position(page, sort_key="user_id"):
+    last = page[-1]
+    if sort_key == "user_id":
+        return (last["user_id"],)
+    return (last[sort_key], last["user_id"])
+
+
+def encode_cursor(position, sort_key="user_id"):
+    payload = json.dumps({"key": sort_key, "after": list(position)}, default=str)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(token, sort_key="user_id"):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except ValueError as err:
+        raise ValueError(f"Malformed pagination cursor: {err}") from None
+    if payload.get("key") != sort_key:
+        raise ValueError(
+            f"Cursor was issued for sort key {payload.get('key')!r}, not {sort_key!r}"
+        )
+    return tuple(payload["after"])
+
+
+def next_cursor(page, sort_key="user_id"):
+    # Token to persist after processing `page`; pass it back as `cursor=`
+    return encode_cursor(page_position(page, sort_key), sort_key)
+
+
+def iter_pages(page_size, keyset, sort_key, cursor):
+    if not keyset:
+        offset = 0
+        while True:
+            page = paginate_users(page_size, offset)
+            if not page:
+                break
+            yield page
+            offset += page_size
+        return
+
+    after = decode_cursor(cursor, sort_key) if cursor else None
     while True:
-        page = paginate_users(page_size, offset)
+        page = paginate_users_after(page_size, after, sort_key)
         if not page:
             break
         yield page
-        offset += page_size
+        if len(page) < page_size:
+            break
+        after = page_position(page, sort_key)
+
+
+def read_ahead(pages, depth):
+    # A background thread keeps up to `depth` pages fetched ahead of the consumer
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for page in pages:
+                if not put(("page", page)):
+                    return
+            put(("done", None))
+        except Exception as err:
+            put(("error", err))
+        finally:
+            pages.close()
+
+    thread = threading.Thread(target=produce, name="lazy_pagination", daemon=True)
+    thread.start()
+    try:
+        while True:
+            kind, value = buffer.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise value
+            yield value
+    finally:
+        # Also runs when the consumer breaks out early
+        stop.set()
+        thread.join()
+
+
+def lazy_pagination(
+    page_size, keyset=False, sort_key="user_id", cursor=None, prefetch=0
+):
+    pages = iter_pages(page_size, keyset, sort_key, cursor)
+    if prefetch > 0:
+        pages = read_ahead(pages, prefetch)
+    yield from pages
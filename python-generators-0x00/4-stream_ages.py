@@ -1,22 +1,122 @@
 # 3-avg_age.py
-seed = __import__("seed")
+from concurrent.futures import ProcessPoolExecutor
+
+db_pool = __import__("db_pool")
+
+# Set in each worker process by use_factory
+worker_factory = None
 
 
 def stream_user_ages():
-    connection = seed.connect_to_prodev()
-    cursor = connection.cursor(dictionary=True)
-    cursor.execute("SELECT age FROM user_data")
-    for row in cursor:
-        yield row["age"]
-    connection.close()
+    with db_pool.get_pool().connection() as connection:
+        cursor = connection.cursor(dictionary=True)
+        try:
+            cursor.execute("SELECT age FROM user_data")
+            for row in cursor:
+                yield row["age"]
+        finally:
+            cursor.close()
 
 
-def average_user_age():
+def streamed_age_totals():
     total_age = 0
     count = 0
     for age in stream_user_ages():
         total_age += age
         count += 1
+    return total_age, count
+
+
+def sql_age_totals():
+    with db_pool.get_pool().connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT COALESCE(SUM(age), 0), COUNT(*) FROM user_data")
+        total_age, count = cursor.fetchone()
+        cursor.close()
+    return total_age, count
+
+
+def stored_age_totals():
+    # Maintained by seed's loaders in the same transaction as the rows, one
+    # row per writer
+    with db_pool.get_pool().connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT COALESCE(SUM(age_sum), 0), COALESCE(SUM(row_count), 0) "
+            "FROM user_data_stats"
+        )
+        row = cursor.fetchone()
+        cursor.close()
+    return row
+
+
+def key_ranges(workers):
+    # user_id is a lowercase UUID, so split on its first two hex digits
+    bounds = [f"{i * 256 // workers:02x}" for i in range(1, workers)]
+    return list(zip([None] + bounds, bounds + [None]))
+
+
+def use_factory(factory):
+    global worker_factory
+    worker_factory = factory
+
+
+def age_totals_in_range(lower, upper):
+    # Runs in a worker process, so it opens a private connection
+    connection = worker_factory()
+    clauses, params = [], []
+    if lower is not None:
+        clauses.append("user_id >= %s")
+        params.append(lower)
+    if upper is not None:
+        clauses.append("user_id < %s")
+        params.append(upper)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    cursor = connection.cursor()
+    total_age = 0
+    count = 0
+    try:
+        cursor.execute(f"SELECT age FROM user_data {where}", tuple(params))
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            total_age += sum(row[0] for row in rows)
+            count += len(rows)
+    finally:
+        cursor.close()
+        connection.close()
+    return total_age, count
+
+
+def parallel_age_totals(workers=4, factory=None, context=None):
+    # The factory is handed to the workers rather than read from their own
+    # pool, which a spawned or forkserver worker never configured; it has
+    # to pickle unless the workers are forked
+    factory = factory or db_pool.get_pool().factory
+    lowers, uppers = zip(*key_ranges(workers))
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=use_factory,
+        initargs=(factory,),
+    ) as executor:
+        partials = list(executor.map(age_totals_in_range, lowers, uppers))
+    return sum(p[0] for p in partials), sum(p[1] for p in partials)
+
+
+AGE_TOTALS = {
+    "stream": streamed_age_totals,
+    "sql": sql_age_totals,
+    "incremental": stored_age_totals,
+    "parallel": parallel_age_totals,
+}
+
+
+def average_user_age(mode="stream", **kwargs):
+    if mode not in AGE_TOTALS:
+        raise ValueError(f"Unknown mode {mode!r}, expected one of {list(AGE_TOTALS)}")
+    total_age, count = AGE_TOTALS[mode](**kwargs)
     if count > 0:
         print(f"Average age of users: {total_age / count:.2f}")
     else:
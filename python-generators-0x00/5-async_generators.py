@@ -0,0 +1,158 @@
+# 5-async_generators.py
+import asyncio
+import contextlib
+import os
+
+import aiosqlite
+
+try:
+    import aiomysql
+except ImportError:  # aiosqlite covers PRODEV_SQLITE runs
+    aiomysql = None
+
+db_pool = __import__("db_pool")
+lazy_paginate = __import__("2-lazy_paginate")
+
+
+class SQLiteRows:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    async def fetchmany(self, size):
+        return [dict(row) for row in await self._cursor.fetchmany(size)]
+
+    async def fetchall(self):
+        return [dict(row) for row in await self._cursor.fetchall()]
+
+    async def close(self):
+        await self._cursor.close()
+
+
+class SQLiteSession:
+    def __init__(self, db):
+        self._db = db
+
+    async def execute(self, query, params=()):
+        cursor = await self._db.execute(query.replace("%s", "?"), params)
+        return SQLiteRows(cursor)
+
+
+class MySQLSession:
+    def __init__(self, connection):
+        self._connection = connection
+
+    async def execute(self, query, params=()):
+        # SSDictCursor streams rows from the server like stream_users does
+        cursor = await self._connection.cursor(aiomysql.SSDictCursor)
+        await cursor.execute(query, params)
+        return cursor
+
+
+@contextlib.asynccontextmanager
+async def connect():
+    path = os.environ.get(db_pool.SQLITE_ENV)
+    if path:
+        async with aiosqlite.connect(path) as db:
+            db.row_factory = aiosqlite.Row
+            yield SQLiteSession(db)
+        return
+    if aiomysql is None:
+        raise RuntimeError(f"Install aiomysql or set {db_pool.SQLITE_ENV}")
+    connection = await aiomysql.connect(
+        host="localhost", user="root", password="", db="ALX_prodev"
+    )
+    try:
+        yield MySQLSession(connection)
+    finally:
+        connection.close()
+
+
+async def prefetched(fetch):
+    # The next fetch is already running while the consumer handles this one
+    pending = asyncio.ensure_future(fetch())
+    try:
+        while True:
+            result = await pending
+            if not result:
+                return
+            pending = asyncio.ensure_future(fetch())
+            yield result
+    finally:
+        if not pending.done():
+            pending.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await pending
+
+
+async def fetch_rows(session, query, params=()):
+    rows = await session.execute(query, params)
+    try:
+        return await rows.fetchall()
+    finally:
+        await rows.close()
+
+
+async def stream_query(query, chunk_size):
+    async with connect() as session:
+        rows = await session.execute(query)
+        try:
+            chunks = prefetched(lambda: rows.fetchmany(chunk_size))
+            async with contextlib.aclosing(chunks):
+                async for chunk in chunks:
+                    yield chunk
+        finally:
+            await rows.close()
+
+
+async def async_stream_users(chunk_size=1000):
+    chunks = stream_query("SELECT * FROM user_data", chunk_size)
+    async with contextlib.aclosing(chunks):
+        async for chunk in chunks:
+            for row in chunk:
+                yield row
+
+
+async def async_stream_user_ages(chunk_size=1000):
+    chunks = stream_query("SELECT age FROM user_data", chunk_size)
+    async with contextlib.aclosing(chunks):
+        async for chunk in chunks:
+            for row in chunk:
+                yield row["age"]
+
+
+async def async_lazy_pagination(
+    page_size, keyset=False, sort_key="user_id", cursor=None
+):
+    lazy_paginate.check_sort_key(sort_key)
+    offset = 0
+    after = lazy_paginate.decode_cursor(cursor, sort_key) if cursor else None
+    done = False
+
+    async def next_page():
+        nonlocal offset, after, done
+        if done:
+            return []
+        if keyset:
+            page = await fetch_rows(
+                session,
+                lazy_paginate.seek_query(sort_key, after),
+                lazy_paginate.seek_params(sort_key, after, page_size),
+            )
+        else:
+            page = await fetch_rows(
+                session,
+                "SELECT * FROM user_data LIMIT %s OFFSET %s",
+                (page_size, offset),
+            )
+        offset += page_size
+        if len(page) < page_size:
+            done = True
+        elif keyset:
+            after = lazy_paginate.page_position(page, sort_key)
+        return page
+
+    async with connect() as session:
+        pages = prefetched(next_page)
+        async with contextlib.aclosing(pages):
+            async for page in pages:
+                yield page
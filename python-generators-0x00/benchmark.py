@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the user_data generators.
+
+Each bench_* function prints its own report; run the module to execute
+all of them against the ALX_prodev database configured in seed.py.
+"""
+import asyncio
+import contextlib
+import csv
+import functools
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+import uuid
+
+seed = __import__("seed")
+lazy_paginate = __import__("2-lazy_paginate")
+stream_users = __import__("0-stream_users").stream_users
+batch_processing = __import__("1-batch_processing")
+async_generators = __import__("5-async_generators")
+
+
+def write_users_csv(path, rows, start=0):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["name", "email", "age"])
+        for i in range(start, start + rows):
+            writer.writerow([f"User {i}", f"user{i}@example.com", 18 + i % 80])
+
+
+def ensure_seeded(rows):
+    connection = seed.connect_db()
+    seed.create_database(connection)
+    connection.close()
+    connection = seed.connect_to_prodev()
+    seed.create_table(connection)
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM user_data")
+    existing = cursor.fetchone()[0]
+    cursor.close()
+    if existing < rows:
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        os.close(fd)
+        try:
+            write_users_csv(path, rows - existing, start=existing)
+            seed.insert_data(connection, path)
+        finally:
+            os.remove(path)
+    connection.close()
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def bench_pagination(page_size=100, pages=(1, 10, 100, 1000, 10000), repeat=5):
+    ensure_seeded(page_size * max(pages))
+    connection = seed.connect_to_prodev()
+    print(f"page fetch latency, page_size={page_size} (best of {repeat})")
+    print(f"{'page':>8} {'offset ms':>12} {'keyset ms':>12}")
+    for page in pages:
+        offset = (page - 1) * page_size
+        after = None
+        if offset:
+            # Seek position is looked up outside the timed region
+            cursor = connection.cursor()
+            cursor.execute(
+                "SELECT user_id FROM user_data ORDER BY user_id LIMIT 1 OFFSET %s",
+                (offset - 1,),
+            )
+            after = (cursor.fetchone()[0],)
+            cursor.close()
+        offset_best = min(
+            timed(lazy_paginate.paginate_users, page_size, offset)[0]
+            for _ in range(repeat)
+        )
+        keyset_best = min(
+            timed(lazy_paginate.paginate_users_after, page_size, after)[0]
+            for _ in range(repeat)
+        )
+        print(f"{page:>8} {offset_best * 1000:>12.2f} {keyset_best * 1000:>12.2f}")
+    connection.close()
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench_stream_memory(rows=5_000_000, chunk_size=1000, limit_mb=64):
+    ensure_seeded(rows)
+    streamed = 0
+    baseline = None
+    start = time.perf_counter()
+    for _ in stream_users(chunk_size):
+        streamed += 1
+        if streamed == chunk_size * 10:
+            baseline = peak_rss_mb()
+    elapsed = time.perf_counter() - start
+    growth = peak_rss_mb() - (baseline or peak_rss_mb())
+    print(
+        f"streamed {streamed} rows in {elapsed:.1f}s, chunk_size={chunk_size}, "
+        f"peak RSS growth after warm-up {growth:.1f} MB"
+    )
+    assert growth < limit_mb, f"RSS grew by {growth:.1f} MB while streaming"
+
+
+def write_users_json(path, size_mb, ndjson=False):
+    user = {"name": "User", "email": "user@example.com", "age": 42}
+    line = json.dumps(user)
+    count = size_mb * 1024 * 1024 // (len(line) + 2)
+    with open(path, "w", encoding="utf-8") as f:
+        if ndjson:
+            f.writelines(line + "\n" for _ in range(count))
+        else:
+            f.write("[\n")
+            f.writelines(line + ",\n" for _ in range(count - 1))
+            f.write(line + "\n]\n")
+
+
+def json_load_batches(path, batch_size):
+    # The implementation stream_users_in_batches had before streaming
+    with open(path, "r") as f:
+        users = json.load(f)
+        for i in range(0, len(users), batch_size):
+            yield users[i : i + batch_size]
+
+
+def mmap_batches(path, batch_size):
+    return batch_processing.stream_users_in_batches(batch_size, path, use_mmap=True)
+
+
+def streaming_batches(path, batch_size):
+    return batch_processing.stream_users_in_batches(batch_size, path)
+
+
+def measure_batches(reader, path, batch_size):
+    start = time.perf_counter()
+    first = None
+    for _ in reader(path, batch_size):
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start, peak_rss_mb()
+
+
+def bench_json_batches(size_mb=2048, batch_size=1000):
+    fd, path = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    # A fresh interpreter per reader keeps the peak RSS figures independent
+    context = multiprocessing.get_context("spawn")
+    try:
+        for ndjson in (False, True):
+            write_users_json(path, size_mb, ndjson)
+            print(f"{'NDJSON' if ndjson else 'JSON array'}, {size_mb} MB")
+            print(f"{'reader':>10} {'first batch s':>14} {'total s':>9} {'peak MB':>9}")
+            readers = [streaming_batches, mmap_batches]
+            if not ndjson:
+                readers.insert(0, json_load_batches)
+            for reader in readers:
+                with context.Pool(1) as pool:
+                    first, total, peak = pool.apply(
+                        measure_batches, (reader, path, batch_size)
+                    )
+                name = reader.__name__.replace("_batches", "")
+                print(f"{name:>10} {first:>14.3f} {total:>9.1f} {peak:>9.0f}")
+    finally:
+        os.remove(path)
+
+
+def bench_batch_filter(rows=1_000_000, batch_size=10000):
+    # Batches are built up front so only the filter and write stage is timed
+    batches = [
+        [
+            {"name": f"User {i}", "email": f"user{i}@example.com", "age": i % 80}
+            for i in range(start, min(start + batch_size, rows))
+        ]
+        for start in range(0, rows, batch_size)
+    ]
+    print(f"age > 25 over {rows} rows, batch_size={batch_size}")
+    numpy = batch_processing.np
+    variants = [("row", False, numpy), ("columnar", True, numpy),
+                ("no numpy", True, None)]
+    try:
+        for mode, columnar, batch_processing.np in variants:
+            with open(os.devnull, "w") as out:
+                start = time.perf_counter()
+                for batch in batches:
+                    batch_processing.process_batch(batch, columnar=columnar, out=out)
+                elapsed = time.perf_counter() - start
+            print(f"{mode:>10} {rows / elapsed:>14,.0f} rows/s")
+    finally:
+        batch_processing.np = numpy
+
+
+def insert_rows_one_by_one(connection, csv_file):
+    # The per-row INSERT loop seed.insert_data used before batching
+    cursor = connection.cursor()
+    with open(csv_file, newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            cursor.execute(
+                seed.INSERT_USER,
+                (str(uuid.uuid4()), row["name"], row["email"], row["age"]),
+            )
+    connection.commit()
+    cursor.close()
+
+
+def bench_seed(rows=100_000, batch_sizes=(100, 1000, 10000)):
+    ensure_seeded(0)
+    connection = seed.connect_to_prodev(allow_local_infile=True)
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM user_data")
+    start = cursor.fetchone()[0] + 1_000_000_000
+    cursor.close()
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    loaders = [("per-row", insert_rows_one_by_one)]
+    loaders += [
+        (f"batch {size}", functools.partial(seed.insert_data, batch_size=size,
+                                            progress_every=0))
+        for size in batch_sizes
+    ]
+    loaders.append(("load data", functools.partial(seed.insert_data, load_data=True)))
+    loaders.append(
+        ("pipeline", lambda _, csv_file: seed.insert_data_parallel(csv_file))
+    )
+    print(f"seeding {rows} new rows per loader")
+    try:
+        for name, loader in loaders:
+            # Fresh emails each time so no loader skips rows as duplicates
+            write_users_csv(path, rows, start=start)
+            start += rows
+            elapsed, _ = timed(loader, connection, path)
+            print(f"{name:>12} {rows / elapsed:>12,.0f} rows/s")
+    finally:
+        os.remove(path)
+        connection.close()
+
+
+def bench_async_overlap(pages=200, page_size=500, cost_per_row=0.00002):
+    ensure_seeded(pages * page_size)
+    cost = page_size * cost_per_row
+
+    def sync_run():
+        for count, _ in enumerate(lazy_paginate.lazy_pagination(page_size, True), 1):
+            time.sleep(cost)
+            if count == pages:
+                break
+
+    async def async_run():
+        count = 0
+        stream = async_generators.async_lazy_pagination(page_size, True)
+        async with contextlib.aclosing(stream):
+            async for _ in stream:
+                await asyncio.sleep(cost)
+                count += 1
+                if count == pages:
+                    break
+
+    sync_elapsed, _ = timed(sync_run)
+    async_elapsed, _ = timed(asyncio.run, async_run())
+    print(
+        f"{pages} keyset pages of {page_size}, {cost * 1000:.1f} ms processing each"
+    )
+    print(f"{'sync':>10} {sync_elapsed:>8.2f} s")
+    print(f"{'async':>10} {async_elapsed:>8.2f} s "
+          f"({sync_elapsed / async_elapsed:.2f}x, fetch overlapped with processing)")
+
+
+def bench_prefetch(
+    pages=200, page_size=500, cost_per_row=0.00002, depths=(0, 1, 2, 4)
+):
+    ensure_seeded(pages * page_size)
+    cost = page_size * cost_per_row
+    print(
+        f"{pages} keyset pages of {page_size}, {cost * 1000:.1f} ms processing each"
+    )
+    for depth in depths:
+        start = time.perf_counter()
+        stream = lazy_paginate.lazy_pagination(page_size, True, prefetch=depth)
+        for count, _ in enumerate(stream, 1):
+            time.sleep(cost)
+            if count == pages:
+                break
+        stream.close()
+        elapsed = time.perf_counter() - start
+        print(f"{'prefetch ' + str(depth):>12} {elapsed:>8.2f} s")
+
+
+if __name__ == "__main__":
+    bench_pagination()
+    bench_stream_memory()
+    bench_json_batches()
+    bench_batch_filter()
+    bench_seed()
+    bench_async_overlap()
+    bench_prefetch()
@@ -0,0 +1,250 @@
+# db_pool.py
+import contextlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from decimal import Decimal
+
+# Point this at a file to run the generators against SQLite instead of MySQL
+SQLITE_ENV = "PRODEV_SQLITE"
+
+
+class PoolError(Exception):
+    pass
+
+
+class PoolTimeout(PoolError):
+    pass
+
+
+class SQLiteCursor:
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    @staticmethod
+    def _translate(query, params):
+        # mysql.connector only expands placeholders when params are given
+        if params is None:
+            return query
+        return query.replace("%s", "?").replace("%%", "%")
+
+    @staticmethod
+    def _params(params):
+        # sqlite3 cannot bind Decimal; its text form keeps numeric affinity
+        return tuple(str(p) if isinstance(p, Decimal) else p for p in params)
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip((col[0] for col in self._cursor.description), row))
+
+    def execute(self, query, params=None):
+        if params is None:
+            self._cursor.execute(self._translate(query, params))
+        else:
+            self._cursor.execute(self._translate(query, params), self._params(params))
+
+    def executemany(self, query, seq_params):
+        self._cursor.executemany(
+            self._translate(query, ()), (self._params(p) for p in seq_params)
+        )
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        for row in self._cursor:
+            yield self._row(row)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    # Just enough of the mysql.connector connection API for the generators
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+
+    def cursor(self, dictionary=False, buffered=None):
+        return SQLiteCursor(self._connection.cursor(), dictionary)
+
+    def is_connected(self):
+        try:
+            self._connection.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def close(self):
+        self._connection.close()
+
+
+def connect_sqlite(path):
+    return SQLiteConnection(path)
+
+
+def is_alive(connection):
+    try:
+        return connection.is_connected()
+    except Exception:
+        return False
+
+
+class ConnectionPool:
+    def __init__(self, factory, size=5, timeout=10.0, health_check=is_alive):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self.health_check = health_check
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+    @property
+    def opened(self):
+        return self._opened
+
+    @property
+    def idle(self):
+        return self._idle.qsize()
+
+    def _open(self):
+        with self._lock:
+            if self._closed:
+                raise PoolError("Pool is closed")
+            if self._opened >= self.size:
+                return None
+            self._opened += 1
+        try:
+            connection = self.factory()
+        except Exception:
+            self._forget()
+            raise
+        if connection is None:
+            self._forget()
+            raise PoolError("Could not open a database connection")
+        return connection
+
+    def _forget(self):
+        with self._lock:
+            self._opened -= 1
+
+    def discard(self, connection):
+        self._forget()
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def acquire(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._open()
+                if connection is None:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        connection = self._idle.get(timeout=max(remaining, 0))
+                    except queue.Empty:
+                        raise PoolTimeout(
+                            f"No connection available within {timeout}s "
+                            f"(pool size {self.size})"
+                        ) from None
+            if self.health_check(connection):
+                return connection
+            self.discard(connection)
+
+    def release(self, connection):
+        # A connection that cannot be reset is not safe to hand out again
+        try:
+            connection.rollback()
+        except Exception:
+            self.discard(connection)
+            return
+        if self._closed:
+            self.discard(connection)
+            return
+        self._idle.put(connection)
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(connection)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def default_factory():
+    path = os.environ.get(SQLITE_ENV)
+    if path:
+        return connect_sqlite(path)
+    seed = __import__("seed")
+    return seed.connect_to_prodev()
+
+
+def configure(factory=None, size=5, timeout=10.0):
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = ConnectionPool(factory or default_factory, size, timeout)
+        return _pool
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(default_factory)
+        return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
@@ -1,6 +1,13 @@
 import mysql.connector
 import csv
+import itertools
+import queue
+import threading
+import time
 import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
 
 DB_NAME = "ALX_prodev"
 
@@ -28,10 +35,14 @@ def create_database(connection):
         cursor.close()
 
 
-def connect_to_prodev():
+def connect_to_prodev(allow_local_infile=False):
     try:
         connection = mysql.connector.connect(
-            host="localhost", user="root", password="", database=DB_NAME
+            host="localhost",
+            user="root",
+            password="",
+            database=DB_NAME,
+            allow_local_infile=allow_local_infile,
         )
         return connection
     except mysql.connector.Error as err:
@@ -48,7 +59,8 @@ def create_table(connection):
                 user_id VARCHAR(36) PRIMARY KEY,
                 name VARCHAR(255) NOT NULL,
                 email VARCHAR(255) NOT NULL,
-                age DECIMAL NOT NULL
+                age DECIMAL NOT NULL,
+                INDEX idx_user_data_email (email)
             );
         """
         )
@@ -57,28 +69,346 @@ def create_table(connection):
         print(f"Table creation failed: {err}")
     finally:
         cursor.close()
+    create_email_index(connection)
+    create_stats_table(connection)
+
+
+def create_email_index(connection):
+    # CREATE TABLE IF NOT EXISTS skips the index on a table that predates it,
+    # and the dedupe in load_data_infile scans the table per row without it
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT COUNT(*) FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = 'user_data'
+            AND index_name = 'idx_user_data_email'
+        """
+        )
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("CREATE INDEX idx_user_data_email ON user_data (email)")
+            print("Index idx_user_data_email created successfully")
+    except mysql.connector.Error as err:
+        print(f"Index creation failed: {err}")
+    finally:
+        cursor.close()
 
 
-def insert_data(connection, csv_file):
+def create_stats_table(connection):
+    # Running SUM/COUNT of age so the average is a read of a few rows. Row 1
+    # belongs to the sequential loaders, row n + 2 to parallel writer n.
     cursor = connection.cursor()
     try:
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_data_stats (
+                id TINYINT PRIMARY KEY,
+                age_sum DECIMAL(30, 2) NOT NULL,
+                row_count BIGINT NOT NULL
+            );
+        """
+        )
+        # Backfill once from rows loaded before the stats table existed
+        cursor.execute(
+            """
+            INSERT IGNORE INTO user_data_stats (id, age_sum, row_count)
+            SELECT 1, COALESCE(SUM(age), 0), COUNT(*) FROM user_data
+        """
+        )
+        connection.commit()
+    except mysql.connector.Error as err:
+        print(f"Stats table creation failed: {err}")
+    finally:
+        cursor.close()
+
+
+def update_stats(cursor, age_sum, row_count, slot=1):
+    # Runs in the caller's transaction; only one writer ever owns a slot
+    cursor.execute(
+        """
+        UPDATE user_data_stats
+        SET age_sum = age_sum + %s, row_count = row_count + %s
+        WHERE id = %s
+    """,
+        (age_sum, row_count, slot),
+    )
+    if cursor.rowcount == 0:
+        cursor.execute(
+            "INSERT INTO user_data_stats (id, age_sum, row_count) VALUES (%s, %s, %s)",
+            (slot, age_sum, row_count),
+        )
+
+
+INSERT_USER = """
+    INSERT INTO user_data (user_id, name, email, age)
+    VALUES (%s, %s, %s, %s)
+"""
+
+
+def existing_emails(connection):
+    # One scan up front instead of a lookup per CSV row
+    cursor = connection.cursor()
+    cursor.execute("SELECT email FROM user_data")
+    emails = {row[0] for row in cursor}
+    cursor.close()
+    return emails
+
+
+def parse_row(row):
+    # (name, email, age) from a CSV row; ValueError says what is wrong
+    name = (row.get("name") or "").strip()
+    email = (row.get("email") or "").strip()
+    if not name or "@" not in email:
+        raise ValueError("missing name or invalid email")
+    try:
+        age = Decimal(row.get("age") or "")
+    except InvalidOperation:
+        age = None
+    if age is None or not age.is_finite() or age < 0:
+        raise ValueError(f"invalid age {row.get('age')!r}")
+    return name, email, str(age)
+
+
+def insert_batch(connection, cursor, batch, slot=1):
+    # Rows come from parse_row, so every age is a valid decimal
+    cursor.executemany(INSERT_USER, batch)
+    update_stats(cursor, sum(Decimal(row[3]) for row in batch), len(batch), slot)
+    connection.commit()
+
+
+def report_progress(inserted, started):
+    elapsed = time.perf_counter() - started
+    print(f"Inserted {inserted} rows ({inserted / max(elapsed, 1e-9):.0f} rows/s)")
+
+
+def insert_data(
+    connection, csv_file, batch_size=1000, progress_every=100000, load_data=False
+):
+    if load_data:
+        return load_data_infile(connection, csv_file)
+    cursor = connection.cursor()
+    started = time.perf_counter()
+    inserted = 0
+    reported = 0
+    try:
+        seen = existing_emails(connection)
         with open(csv_file, newline="", encoding="utf-8") as file:
             reader = csv.DictReader(file)
+            batch = []
             for row in reader:
-                user_id = str(uuid.uuid4())
-                name = row["name"]
-                email = row["email"]
-                age = row["age"]
-                # Avoid duplicates using INSERT IGNORE or REPLACE as needed
-                cursor.execute(
-                    """
-                    INSERT INTO user_data (user_id, name, email, age)
-                    VALUES (%s, %s, %s, %s)
-                """,
-                    (user_id, name, email, age),
-                )
-        connection.commit()
+                # A bad row is reported and skipped rather than failing its
+                # whole batch, which a re-run would only hit again
+                try:
+                    name, email, age = parse_row(row)
+                except ValueError as e:
+                    print(f"Skipping line {reader.line_num}: {e}")
+                    continue
+                # Skipping known emails makes re-running a partial load safe
+                if email in seen:
+                    continue
+                seen.add(email)
+                batch.append((str(uuid.uuid4()), name, email, age))
+                if len(batch) >= batch_size:
+                    insert_batch(connection, cursor, batch)
+                    inserted += len(batch)
+                    batch = []
+                    if progress_every and inserted - reported >= progress_every:
+                        report_progress(inserted, started)
+                        reported = inserted
+            if batch:
+                insert_batch(connection, cursor, batch)
+                inserted += len(batch)
+        if progress_every:
+            report_progress(inserted, started)
     except Exception as e:
+        connection.rollback()
         print(f"Error inserting data: {e}")
     finally:
         cursor.close()
+    return inserted
+
+
+def load_data_infile(connection, csv_file):
+    # Needs a connection opened with connect_to_prodev(allow_local_infile=True)
+    cursor = connection.cursor()
+    inserted = 0
+    try:
+        with open(csv_file, newline="", encoding="utf-8") as file:
+            header = next(csv.reader(file))
+        if not all(column.isidentifier() for column in header):
+            raise ValueError(f"Unsupported CSV header: {header}")
+        variables = ", ".join(f"@{column}" for column in header)
+        cursor.execute(
+            """
+            CREATE TEMPORARY TABLE user_data_staging (
+                name VARCHAR(255) NOT NULL,
+                email VARCHAR(255) NOT NULL,
+                age DECIMAL NOT NULL
+            );
+        """
+        )
+        cursor.execute(
+            f"""
+            LOAD DATA LOCAL INFILE %s INTO TABLE user_data_staging
+            CHARACTER SET utf8mb4
+            FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"'
+            LINES TERMINATED BY '\\n' IGNORE 1 LINES ({variables})
+            SET name = @name, email = @email, age = @age
+        """,
+            (csv_file,),
+        )
+        # Same idempotency as the batched path: unseen emails only, once each
+        cursor.execute(
+            """
+            CREATE TEMPORARY TABLE user_data_new AS
+            SELECT UUID() AS user_id, MIN(s.name) AS name, s.email, MIN(s.age) AS age
+            FROM user_data_staging s
+            WHERE NOT EXISTS (SELECT 1 FROM user_data u WHERE u.email = s.email)
+            GROUP BY s.email
+        """
+        )
+        cursor.execute(
+            """
+            INSERT INTO user_data (user_id, name, email, age)
+            SELECT user_id, name, email, age FROM user_data_new
+        """
+        )
+        inserted = cursor.rowcount
+        cursor.execute("SELECT COALESCE(SUM(age), 0), COUNT(*) FROM user_data_new")
+        update_stats(cursor, *cursor.fetchone())
+        connection.commit()
+        print(f"Loaded {inserted} rows with LOAD DATA LOCAL INFILE")
+    except Exception as e:
+        connection.rollback()
+        print(f"Error loading data: {e}")
+    finally:
+        try:
+            cursor.execute(
+                "DROP TEMPORARY TABLE IF EXISTS user_data_staging, user_data_new"
+            )
+        except Exception:
+            # Cleanup only; the SQLite stand-in has no DROP TEMPORARY TABLE
+            pass
+        cursor.close()
+    return inserted
+
+
+def read_line_chunks(csv_file, chunk_size):
+    # Raw lines only; parsing happens in the worker processes. Assumes no
+    # quoted field spans a line break, which holds for the user CSVs.
+    with open(csv_file, newline="", encoding="utf-8") as file:
+        header = next(csv.reader([file.readline()]))
+        first_line = 2
+        while True:
+            lines = list(itertools.islice(file, chunk_size))
+            if not lines:
+                break
+            yield header, first_line, lines
+            first_line += len(lines)
+
+
+def parse_chunk(header, first_line, lines):
+    rows = []
+    errors = []
+    reader = csv.DictReader(lines, fieldnames=header)
+    for line, row in enumerate(reader, start=first_line):
+        try:
+            name, email, age = parse_row(row)
+        except ValueError as e:
+            errors.append((line, str(e)))
+            continue
+        rows.append((str(uuid.uuid4()), name, email, age))
+    return rows, errors
+
+
+def write_batches(connection, batches, reports, slot):
+    # Each writer keeps its own stats row, so the writers' commits don't
+    # queue on one row lock while rows and stats still commit together
+    cursor = connection.cursor()
+    try:
+        while True:
+            item = batches.get()
+            if item is None:
+                break
+            index, rows = item
+            try:
+                insert_batch(connection, cursor, rows, slot)
+                reports[index]["inserted"] = len(rows)
+            except Exception as e:
+                connection.rollback()
+                reports[index]["errors"].append((None, f"insert failed: {e}"))
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def insert_data_parallel(
+    csv_file, parsers=None, writers=4, chunk_size=10000, queue_size=8, connect=None
+):
+    connect = connect or connect_to_prodev
+    connections = [connect() for _ in range(writers + 1)]
+    if not all(connections):
+        for connection in filter(None, connections):
+            connection.close()
+        raise RuntimeError("Could not open a connection for every writer")
+    seen = existing_emails(connections[0])
+    connections[0].close()
+
+    # Bounded on both sides: at most queue_size chunks parsing and queue_size
+    # batches waiting for a writer, so a slow database throttles the reader
+    batches = queue.Queue(maxsize=queue_size)
+    reports = []
+    threads = [
+        threading.Thread(
+            target=write_batches, args=(connection, batches, reports, slot + 2)
+        )
+        for slot, connection in enumerate(connections[1:])
+    ]
+    for thread in threads:
+        thread.start()
+
+    def dispatch(first_line, future):
+        rows, errors = future.result()
+        fresh = []
+        for row in rows:
+            if row[2] not in seen:
+                seen.add(row[2])
+                fresh.append(row)
+        reports.append(
+            {
+                "chunk": len(reports),
+                "first_line": first_line,
+                "parsed": len(rows),
+                "duplicates": len(rows) - len(fresh),
+                "inserted": 0,
+                "errors": errors,
+            }
+        )
+        if fresh:
+            batches.put((len(reports) - 1, fresh))
+
+    started = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=parsers) as executor:
+            pending = deque()
+            for header, first_line, lines in read_line_chunks(csv_file, chunk_size):
+                pending.append(
+                    (first_line, executor.submit(parse_chunk, header, first_line, lines))
+                )
+                if len(pending) >= queue_size:
+                    dispatch(*pending.popleft())
+            while pending:
+                dispatch(*pending.popleft())
+    finally:
+        for _ in threads:
+            batches.put(None)
+        for thread in threads:
+            thread.join()
+
+    inserted = sum(report["inserted"] for report in reports)
+    report_progress(inserted, started)
+    for report in reports:
+        for line, message in report["errors"]:
+            where = f"line {line}" if line else f"from line {report['first_line']}"
+            print(f"Chunk {report['chunk']} {where}: {message}")
+    return reports
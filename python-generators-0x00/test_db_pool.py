@@ -0,0 +1,663 @@
+#!/usr/bin/env python3
+"""
+Unittests for the db_pool module and the generators, run against the
+SQLite stand-in where they need a database.
+"""
+
+import asyncio
+import csv
+import functools
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import unittest
+from contextlib import aclosing, redirect_stdout
+from decimal import Decimal
+
+db_pool = __import__("db_pool")
+
+
+def seed_sqlite(path, rows):
+    """Create a user_data table with `rows` users in a SQLite file."""
+    connection = db_pool.connect_sqlite(path)
+    cursor = connection.cursor()
+    cursor.execute(
+        "CREATE TABLE user_data (user_id VARCHAR(36) PRIMARY KEY, "
+        "name VARCHAR(255) NOT NULL, email VARCHAR(255) NOT NULL, "
+        "age DECIMAL NOT NULL)"
+    )
+    cursor.executemany(
+        "INSERT INTO user_data (user_id, name, email, age) VALUES (%s, %s, %s, %s)",
+        [(f"{i:08d}", f"User {i}", f"user{i}@example.com", 20 + i % 50)
+         for i in range(rows)],
+    )
+    connection.commit()
+    connection.close()
+
+
+def add_stats_sqlite(path):
+    """Create user_data_stats backfilled from user_data, as seed does."""
+    connection = db_pool.connect_sqlite(path)
+    cursor = connection.cursor()
+    cursor.execute(
+        "CREATE TABLE user_data_stats (id TINYINT PRIMARY KEY, "
+        "age_sum DECIMAL(30, 2) NOT NULL, row_count BIGINT NOT NULL)"
+    )
+    cursor.execute(
+        "INSERT INTO user_data_stats (id, age_sum, row_count) "
+        "SELECT 1, COALESCE(SUM(age), 0), COUNT(*) FROM user_data"
+    )
+    connection.commit()
+    connection.close()
+
+
+class SQLiteTestCase(unittest.TestCase):
+    """
+    Base case providing a seeded SQLite database file.
+    """
+
+    rows = 25
+
+    def setUp(self) -> None:
+        """Create and seed a temporary database."""
+        fd, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        seed_sqlite(self.path, self.rows)
+
+    def tearDown(self) -> None:
+        """Remove the temporary database."""
+        os.remove(self.path)
+
+
+class TestSQLiteConnection(SQLiteTestCase):
+    """
+    Tests for the mysql.connector-shaped SQLite wrapper.
+    """
+
+    def test_dictionary_rows_and_placeholders(self) -> None:
+        """Test %s placeholders are translated and rows come back as dicts."""
+        connection = db_pool.connect_sqlite(self.path)
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT * FROM user_data WHERE user_id = %s", ("00000003",))
+        self.assertEqual(
+            cursor.fetchone(),
+            {"user_id": "00000003", "name": "User 3",
+             "email": "user3@example.com", "age": 23},
+        )
+        connection.close()
+
+    def test_is_connected(self) -> None:
+        """Test is_connected reflects a closed connection."""
+        connection = db_pool.connect_sqlite(self.path)
+        self.assertTrue(connection.is_connected())
+        connection.close()
+        self.assertFalse(connection.is_connected())
+
+
+class TestConnectionPool(SQLiteTestCase):
+    """
+    Tests for db_pool.ConnectionPool.
+    """
+
+    def make_pool(self, size=2, timeout=0.1):
+        """Build a pool of SQLite stand-in connections."""
+        self.opened = 0
+
+        def factory():
+            self.opened += 1
+            return db_pool.connect_sqlite(self.path)
+
+        return db_pool.ConnectionPool(factory, size=size, timeout=timeout)
+
+    def test_reuses_connection(self) -> None:
+        """Test sequential checkouts share one connection."""
+        pool = self.make_pool()
+        for _ in range(10):
+            with pool.connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute("SELECT COUNT(*) FROM user_data")
+                self.assertEqual(cursor.fetchone(), (self.rows,))
+                cursor.close()
+        self.assertEqual(self.opened, 1)
+        pool.close()
+
+    def test_checkout_timeout(self) -> None:
+        """Test acquire raises PoolTimeout once the pool is exhausted."""
+        pool = self.make_pool(size=1)
+        held = pool.acquire()
+        with self.assertRaises(db_pool.PoolTimeout):
+            pool.acquire()
+        pool.release(held)
+        pool.release(pool.acquire())
+        pool.close()
+
+    def test_waiter_gets_released_connection(self) -> None:
+        """Test a blocked checkout is served by a release from another thread."""
+        pool = self.make_pool(size=1, timeout=5)
+        held = pool.acquire()
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+        waiter.start()
+        pool.release(held)
+        waiter.join()
+        self.assertIs(got[0], held)
+        pool.release(got[0])
+        pool.close()
+
+    def test_unhealthy_connection_is_replaced(self) -> None:
+        """Test a connection failing its health check is discarded."""
+        pool = self.make_pool()
+        with pool.connection() as connection:
+            pass
+        connection.close()
+        with pool.connection() as replacement:
+            self.assertIsNot(replacement, connection)
+        self.assertEqual(self.opened, 2)
+        self.assertEqual(pool.opened, 1)
+        pool.close()
+
+
+class TestGeneratorsOnPool(SQLiteTestCase):
+    """
+    Tests for the user_data generators drawing from the default pool.
+    """
+
+    def setUp(self) -> None:
+        """Route the default pool at the seeded SQLite file."""
+        super().setUp()
+        db_pool.configure(functools.partial(db_pool.connect_sqlite, self.path), size=1)
+
+    def tearDown(self) -> None:
+        """Drop the SQLite-backed default pool."""
+        db_pool.close_pool()
+        super().tearDown()
+
+    def test_lazy_pagination_uses_one_connection(self) -> None:
+        """Test every page is fetched on the same pooled connection."""
+        lazy_paginate = __import__("2-lazy_paginate")
+        pages = list(lazy_paginate.lazy_pagination(10))
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(db_pool.get_pool().opened, 1)
+
+    def test_keyset_pagination_resumes_from_cursor(self) -> None:
+        """Test a persisted cursor resumes where the previous run stopped."""
+        lazy_paginate = __import__("2-lazy_paginate")
+        first = next(lazy_paginate.lazy_pagination(10, keyset=True))
+        token = lazy_paginate.next_cursor(first)
+        rest = list(lazy_paginate.lazy_pagination(10, keyset=True, cursor=token))
+        ids = [row["user_id"] for page in [first] + rest for row in page]
+        self.assertEqual(ids, [f"{i:08d}" for i in range(self.rows)])
+
+    def test_cursor_round_trip(self) -> None:
+        """Test a cursor decodes to the position it was made from."""
+        lazy_paginate = __import__("2-lazy_paginate")
+        page = [{"user_id": "00000007", "age": Decimal("27")}]
+        token = lazy_paginate.next_cursor(page, "age")
+        self.assertEqual(lazy_paginate.decode_cursor(token, "age"),
+                         ("27", "00000007"))
+        token = lazy_paginate.next_cursor(page)
+        self.assertEqual(lazy_paginate.decode_cursor(token), ("00000007",))
+
+    def test_cursor_for_another_sort_key_is_refused(self) -> None:
+        """Test a cursor only resumes the ordering that issued it."""
+        lazy_paginate = __import__("2-lazy_paginate")
+        first = next(lazy_paginate.lazy_pagination(10, keyset=True))
+        token = lazy_paginate.next_cursor(first)
+        with self.assertRaisesRegex(ValueError, "sort key 'user_id', not 'age'"):
+            next(lazy_paginate.lazy_pagination(
+                10, keyset=True, sort_key="age", cursor=token))
+        with self.assertRaisesRegex(ValueError, "Malformed pagination cursor"):
+            lazy_paginate.decode_cursor("not a cursor!")
+        with self.assertRaises(ValueError):
+            lazy_paginate.check_sort_key("age; DROP TABLE user_data")
+
+    def test_keyset_pagination_breaks_ties_on_user_id(self) -> None:
+        """Test pages over a non-unique key cut through ties without gaps."""
+        lazy_paginate = __import__("2-lazy_paginate")
+        connection = db_pool.connect_sqlite(self.path)
+        cursor = connection.cursor()
+        cursor.execute("UPDATE user_data SET age = 20 + CAST(user_id AS INTEGER) % 3")
+        connection.commit()
+        connection.close()
+        expected = sorted(
+            ((20 + i % 3, f"{i:08d}") for i in range(self.rows)))
+        first = next(lazy_paginate.lazy_pagination(4, keyset=True, sort_key="age"))
+        token = lazy_paginate.next_cursor(first, "age")
+        rest = lazy_paginate.lazy_pagination(
+            4, keyset=True, sort_key="age", cursor=token)
+        rows = [row for page in [first, *rest] for row in page]
+        self.assertEqual([(row["age"], row["user_id"]) for row in rows], expected)
+
+    def test_lazy_pagination_read_ahead(self) -> None:
+        """Test prefetched pages match and an early break stops the thread."""
+        lazy_paginate = __import__("2-lazy_paginate")
+        for keyset in (False, True):
+            pages = list(lazy_paginate.lazy_pagination(10, keyset, prefetch=2))
+            self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        for page in lazy_paginate.lazy_pagination(5, prefetch=3):
+            break
+        self.assertEqual(
+            [t for t in threading.enumerate() if t.name == "lazy_pagination"], [])
+
+    def test_stream_users(self) -> None:
+        """Test stream_users yields every row and returns its connection."""
+        stream_users = __import__("0-stream_users").stream_users
+        self.assertEqual(len(list(stream_users())), self.rows)
+        self.assertEqual(db_pool.get_pool().idle, 1)
+
+    def test_stream_users_early_break_drops_connection(self) -> None:
+        """Test abandoning a stream part-way does not recycle its connection."""
+        stream_users = __import__("0-stream_users").stream_users
+        stream = stream_users(chunk_size=4)
+        self.assertEqual(len([next(stream) for _ in range(6)]), 6)
+        stream.close()
+        self.assertEqual(db_pool.get_pool().opened, 0)
+        self.assertEqual(len(list(stream_users(chunk_size=4))), self.rows)
+
+    def test_average_user_age_modes_agree(self) -> None:
+        """Test the streamed, pushed-down and parallel averages match."""
+        stream_ages = __import__("4-stream_ages")
+        outputs = set()
+        for mode, kwargs in [("stream", {}), ("sql", {}), ("parallel", {"workers": 3})]:
+            buffer = io.StringIO()
+            with redirect_stdout(buffer):
+                stream_ages.average_user_age(mode, **kwargs)
+            outputs.add(buffer.getvalue())
+        self.assertEqual(outputs, {"Average age of users: 32.00\n"})
+
+    def test_parallel_workers_get_the_factory(self) -> None:
+        """Test spawned workers use the given factory, not their own pool's."""
+        stream_ages = __import__("4-stream_ages")
+        spawn = multiprocessing.get_context("spawn")
+        self.assertEqual(
+            stream_ages.parallel_age_totals(workers=2, context=spawn),
+            stream_ages.sql_age_totals())
+
+    def test_key_ranges_cover_uuid_space(self) -> None:
+        """Test the worker key ranges are contiguous and unbounded at the ends."""
+        stream_ages = __import__("4-stream_ages")
+        self.assertEqual(
+            stream_ages.key_ranges(4),
+            [(None, "40"), ("40", "80"), ("80", "c0"), ("c0", None)],
+        )
+        self.assertEqual(stream_ages.key_ranges(1), [(None, None)])
+
+
+class TestSeed(SQLiteTestCase):
+    """
+    Tests for the CSV loaders in seed, run against the SQLite stand-in.
+    """
+
+    def setUp(self) -> None:
+        """Add the stats table and a scratch CSV file."""
+        super().setUp()
+        add_stats_sqlite(self.path)
+        self.seed = __import__("seed")
+        fd, self.csv_path = tempfile.mkstemp(suffix=".csv")
+        os.close(fd)
+        self.connection = db_pool.connect_sqlite(self.path)
+
+    def tearDown(self) -> None:
+        """Close the connection and remove the CSV file."""
+        self.connection.close()
+        os.remove(self.csv_path)
+        super().tearDown()
+
+    def write_csv(self, lines):
+        """Write a header plus `lines` to the scratch CSV file."""
+        with open(self.csv_path, "w", encoding="utf-8") as file:
+            file.write("name,email,age\n" + "".join(f"{line}\n" for line in lines))
+
+    def query(self, sql):
+        """Return the single row of a query on the test database."""
+        connection = db_pool.connect_sqlite(self.path)
+        cursor = connection.cursor()
+        cursor.execute(sql)
+        row = cursor.fetchone()
+        connection.close()
+        return row
+
+    def load(self, **kwargs):
+        """Run insert_data quietly; return (inserted, printed output)."""
+        buffer = io.StringIO()
+        with redirect_stdout(buffer):
+            inserted = self.seed.insert_data(
+                self.connection, self.csv_path, batch_size=2, **kwargs)
+        return inserted, buffer.getvalue()
+
+    def test_insert_data_skips_bad_rows(self) -> None:
+        """Test malformed rows are reported by line and the rest load."""
+        self.write_csv([
+            "Ann,ann@example.com,30",
+            "Bob,bob@example.com,thirty",
+            "Cy,not-an-email,40",
+            "Di,di@example.com,NaN",
+            "Ed,ed@example.com,50",
+        ])
+        inserted, output = self.load(progress_every=0)
+        self.assertEqual(inserted, 2)
+        self.assertIn("Skipping line 3: invalid age 'thirty'", output)
+        self.assertIn("Skipping line 4: missing name or invalid email", output)
+        self.assertIn("Skipping line 5: invalid age 'NaN'", output)
+        self.assertEqual(self.query("SELECT COUNT(*) FROM user_data"),
+                         (self.rows + 2,))
+        self.assertEqual(
+            self.query("SELECT SUM(age_sum), SUM(row_count) FROM user_data_stats"),
+            (sum(20 + i % 50 for i in range(self.rows)) + 80, self.rows + 2))
+
+    def test_insert_data_dedupes_emails(self) -> None:
+        """Test known and repeated emails load once, so a re-run is a no-op."""
+        self.write_csv([
+            "User 3,user3@example.com,23",
+            "Fay,fay@example.com,31",
+            "Fay Again,fay@example.com,32",
+            "Gus,gus@example.com,33",
+        ])
+        self.assertEqual(self.load(progress_every=0)[0], 2)
+        self.assertEqual(self.load(progress_every=0)[0], 0)
+        self.assertEqual(
+            self.query("SELECT name FROM user_data WHERE email = 'fay@example.com'"),
+            ("Fay",))
+        self.assertEqual(self.query("SELECT SUM(row_count) FROM user_data_stats"),
+                         (self.rows + 2,))
+
+    def test_load_data_failure_changes_nothing(self) -> None:
+        """Test a refused LOAD DATA is reported and leaves both tables alone."""
+        self.write_csv(["Hal,hal@example.com,40"])
+        inserted, output = self.load(load_data=True)
+        self.assertEqual(inserted, 0)
+        self.assertIn("Error loading data", output)
+        self.assertEqual(self.query("SELECT COUNT(*) FROM user_data"), (self.rows,))
+        self.assertEqual(self.query("SELECT SUM(row_count) FROM user_data_stats"),
+                         (self.rows,))
+
+
+    def test_incremental_average_tracks_loads(self) -> None:
+        """Test the stats row matches a full scan after both loaders."""
+        stream_ages = __import__("4-stream_ages")
+        db_pool.configure(functools.partial(db_pool.connect_sqlite, self.path))
+        self.addCleanup(db_pool.close_pool)
+        self.write_csv(["Ann,ann@example.com,30", "Bob,bob@example.com,x"])
+        self.load(progress_every=0)
+        self.write_csv(["Cy,cy@example.com,71", "Di,di@example.com,44"])
+        self.load_parallel(chunk_size=1)
+        self.assertEqual(stream_ages.stored_age_totals(),
+                         stream_ages.sql_age_totals())
+        outputs = set()
+        for mode in ("incremental", "sql"):
+            buffer = io.StringIO()
+            with redirect_stdout(buffer):
+                stream_ages.average_user_age(mode)
+            outputs.add(buffer.getvalue())
+        self.assertEqual(len(outputs), 1)
+
+    def load_parallel(self, chunk_size=3):
+        """Run insert_data_parallel quietly on stand-in connections."""
+        with redirect_stdout(io.StringIO()):
+            return self.seed.insert_data_parallel(
+                self.csv_path, parsers=2, writers=2, chunk_size=chunk_size,
+                connect=lambda: db_pool.connect_sqlite(self.path))
+
+    def test_parallel_reports_errors_per_chunk(self) -> None:
+        """Test each chunk reports its own bad lines and inserted rows."""
+        self.write_csv([
+            "Ann,ann@example.com,30",
+            "Bob,bob@example.com,-1",
+            "Cy,cy@example.com,31",
+            "Di,di@example.com,32",
+            ",nobody@example.com,33",
+            "Ed,ed@example.com,34",
+        ])
+        reports = self.load_parallel()
+        self.assertEqual(
+            [(r["chunk"], r["first_line"], r["parsed"], r["inserted"])
+             for r in reports],
+            [(0, 2, 2, 2), (1, 5, 2, 2)])
+        self.assertEqual(reports[0]["errors"], [(3, "invalid age '-1'")])
+        self.assertEqual(reports[1]["errors"],
+                         [(6, "missing name or invalid email")])
+        self.assertEqual(
+            self.query("SELECT SUM(age_sum), SUM(row_count) FROM user_data_stats"),
+            (sum(20 + i % 50 for i in range(self.rows)) + 127, self.rows + 4))
+
+    def test_parallel_stats_commit_with_their_rows(self) -> None:
+        """Test a failed batch adds nothing to its writer's stats row."""
+        connection = db_pool.connect_sqlite(self.path)
+        cursor = connection.cursor()
+        cursor.execute(
+            "CREATE TRIGGER reject_bad BEFORE INSERT ON user_data "
+            "WHEN NEW.name = 'Bad' BEGIN SELECT RAISE(ABORT, 'rejected'); END"
+        )
+        connection.commit()
+        connection.close()
+        self.write_csv([
+            "Ann,ann@example.com,30",
+            "Bad,bad@example.com,99",
+            "Cy,cy@example.com,31",
+            "Di,di@example.com,32",
+        ])
+        reports = self.load_parallel(chunk_size=2)
+        self.assertEqual([r["inserted"] for r in reports], [0, 2])
+        self.assertIn("rejected", reports[0]["errors"][0][1])
+        self.assertEqual(
+            self.query("SELECT SUM(age_sum), SUM(row_count) FROM user_data_stats"),
+            self.query("SELECT SUM(age), COUNT(*) FROM user_data"))
+        self.assertEqual(
+            self.query("SELECT COUNT(*) FROM user_data_stats WHERE id > 1"), (1,))
+
+    def test_parallel_dedupes_across_chunks(self) -> None:
+        """Test an email repeated in a later chunk is inserted only once."""
+        self.write_csv([
+            "Fay,fay@example.com,31",
+            "User 3,user3@example.com,23",
+            "Gus,gus@example.com,33",
+            "Fay Again,fay@example.com,32",
+        ])
+        reports = self.load_parallel(chunk_size=2)
+        self.assertEqual([r["duplicates"] for r in reports], [1, 1])
+        self.assertEqual(sum(r["inserted"] for r in reports), 2)
+        self.assertEqual(self.query("SELECT SUM(row_count) FROM user_data_stats"),
+                         (self.rows + 2,))
+
+    def test_parallel_parser_error_stops_writers(self) -> None:
+        """Test a chunk that fails to parse stops every writer thread."""
+        self.write_csv([
+            "Hal,hal@example.com,40",
+            "Ivy," + "x" * (csv.field_size_limit() + 1) + ",41",
+        ])
+        before = threading.active_count()
+        with self.assertRaises(csv.Error):
+            self.load_parallel(chunk_size=1)
+        self.assertEqual(threading.active_count(), before)
+        self.assertEqual(self.query("SELECT COUNT(*) FROM user_data"),
+                         (self.rows + 1,))
+        self.assertEqual(self.query("SELECT SUM(row_count) FROM user_data_stats"),
+                         (self.rows + 1,))
+
+
+class TestAsyncGenerators(SQLiteTestCase):
+    """
+    Tests for the async generators running on aiosqlite.
+    """
+
+    def setUp(self) -> None:
+        """Point the async generators at the seeded SQLite file."""
+        super().setUp()
+        self.previous = os.environ.get(db_pool.SQLITE_ENV)
+        os.environ[db_pool.SQLITE_ENV] = self.path
+        self.module = __import__("5-async_generators")
+
+    def tearDown(self) -> None:
+        """Restore the environment."""
+        if self.previous is None:
+            del os.environ[db_pool.SQLITE_ENV]
+        else:
+            os.environ[db_pool.SQLITE_ENV] = self.previous
+        super().tearDown()
+
+    def collect(self, agen, limit=None):
+        """Drain an async generator, stopping early after `limit` items."""
+        async def run():
+            items = []
+            async with aclosing(agen):
+                async for item in agen:
+                    items.append(item)
+                    if limit is not None and len(items) == limit:
+                        break
+            return items
+        return asyncio.run(run())
+
+    def test_async_stream_users(self) -> None:
+        """Test every row is streamed across several prefetched chunks."""
+        rows = self.collect(self.module.async_stream_users(chunk_size=4))
+        self.assertEqual([row["user_id"] for row in rows],
+                         [f"{i:08d}" for i in range(self.rows)])
+
+    def test_async_stream_user_ages_early_break(self) -> None:
+        """Test breaking out of the stream stops cleanly."""
+        ages = self.collect(self.module.async_stream_user_ages(chunk_size=4), 5)
+        self.assertEqual(ages, [20, 21, 22, 23, 24])
+
+    def test_async_lazy_pagination_matches_sync_pages(self) -> None:
+        """Test offset and keyset pages match the blocking generator."""
+        for keyset in (False, True):
+            pages = self.collect(
+                self.module.async_lazy_pagination(10, keyset=keyset))
+            self.assertEqual([len(page) for page in pages], [10, 10, 5])
+
+
+class TestJsonStreaming(unittest.TestCase):
+    """
+    Tests for the incremental JSON readers in 1-batch_processing.
+    """
+
+    users = [{"name": "Zoë", "age": 31}, {"name": "Łukasz", "age": 24.5},
+             {"name": "Ann", "age": 40}]
+
+    def setUp(self) -> None:
+        """Load the module and make a scratch file."""
+        self.module = __import__("1-batch_processing")
+        fd, self.path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+
+    def tearDown(self) -> None:
+        """Remove the scratch file."""
+        os.remove(self.path)
+
+    def write(self, text):
+        """Write `text` to the scratch file as UTF-8."""
+        with open(self.path, "w", encoding="utf-8") as file:
+            file.write(text)
+
+    def read(self, use_mmap=False, read_size=1):
+        """Parse the scratch file as a JSON array, `read_size` bytes a read."""
+        with open(self.path, "rb") as file:
+            chunks = self.module.read_chunks(file, use_mmap, read_size)
+            return list(self.module.iter_json_array(chunks))
+
+    def test_array_and_ndjson_are_detected(self) -> None:
+        """Test a leading "[" selects the array reader, anything else NDJSON."""
+        for text in ("\n  " + json.dumps(self.users),
+                     "".join(json.dumps(user) + "\n" for user in self.users)):
+            self.write(text)
+            self.assertEqual(list(self.module.iter_users(self.path)), self.users)
+
+    def test_multibyte_characters_split_across_reads(self) -> None:
+        """Test one byte a read keeps every UTF-8 character whole."""
+        self.write("\ufeff" + json.dumps(self.users, ensure_ascii=False))
+        for use_mmap in (False, True):
+            self.assertEqual(self.read(use_mmap), self.users)
+
+    def test_scalars_split_across_reads(self) -> None:
+        """Test a number or literal cut at a read boundary is not yielded early."""
+        values = [123, -4.5e-3, True, None, "x", [12, 3]]
+        self.write(json.dumps(values).replace(" ", ""))
+        self.assertEqual(self.read(), values)
+        self.assertEqual(
+            list(self.module.iter_json_array(["[12", "3, 4", "5]"])), [123, 45])
+
+    def test_mmap_matches_buffered_reads(self) -> None:
+        """Test the mmap path, including an empty file."""
+        self.write(json.dumps(self.users * 50))
+        self.assertEqual(self.read(True, 7), self.read(False, 7))
+        self.assertEqual(
+            list(self.module.iter_users(self.path, use_mmap=True)), self.users * 50)
+        self.write("")
+        self.assertEqual(list(self.module.iter_users(self.path, use_mmap=True)), [])
+
+    def test_malformed_element_fails_fast_with_file_offset(self) -> None:
+        """Test a bad element raises before the rest of the file is read."""
+        def chunks():
+            yield '[{"a": 1}, '
+            yield "oops, "
+            while True:
+                yield '{"a": 1}, '
+
+        with self.assertRaisesRegex(ValueError, "'o' at char 11"):
+            list(self.module.iter_json_array(chunks()))
+        self.write('[{"a": 1},\n {"b" 2}]')
+        with self.assertRaisesRegex(ValueError, "Expecting ':' delimiter at char 17"):
+            self.read(read_size=4)
+
+        def bad_object_then_more():
+            yield '[{"a": 1}, {"b" 2}, '
+            while True:
+                yield '{"a": 1}, '
+
+        with self.assertRaisesRegex(ValueError, "Expecting ':' delimiter at char 16"):
+            list(self.module.iter_json_array(bad_object_then_more()))
+
+    def test_truncated_array_raises(self) -> None:
+        """Test input ending inside or after an element raises ValueError."""
+        for text in ('[{"name": "Ann"}, {"name"', "[1, 2", "[12x]", '{"a": 1}'):
+            self.write(text)
+            with self.assertRaises(ValueError):
+                self.read()
+
+
+class TestBatchFilter(unittest.TestCase):
+    """
+    Tests for the row and columnar filters in 1-batch_processing.
+    """
+
+    batch = [{"name": "Ann", "age": 25}, {"name": "Bob", "age": 31.5},
+             {"name": "Cy"}, {"name": "Di", "age": 0}, {"name": "Ed", "age": 80}]
+
+    def setUp(self) -> None:
+        """Load the module, restoring its NumPy binding afterwards."""
+        self.module = __import__("1-batch_processing")
+        self.addCleanup(setattr, self.module, "np", self.module.np)
+
+    def output(self, columnar, op, threshold=25):
+        """Return what process_batch writes for one filter."""
+        out = io.StringIO()
+        self.module.process_batch(
+            self.batch, "age", op, threshold, columnar=columnar, out=out)
+        return out.getvalue()
+
+    def test_row_and_columnar_agree_for_every_operator(self) -> None:
+        """Test both modes print the same users, missing ages counting as 0."""
+        self.assertIsNotNone(self.module.np)
+        for op in self.module.PREDICATES:
+            with self.subTest(op=op):
+                self.assertEqual(self.output(True, op), self.output(False, op))
+        self.assertEqual(self.output(True, ">"),
+                         f"{self.batch[1]}\n{self.batch[4]}\n")
+        self.assertEqual(self.output(True, "<=", 0),
+                         f"{self.batch[2]}\n{self.batch[3]}\n")
+
+    def test_columnar_without_numpy(self) -> None:
+        """Test the list fallback when NumPy is not installed."""
+        expected = {op: self.output(False, op) for op in self.module.PREDICATES}
+        self.module.np = None
+        for op in self.module.PREDICATES:
+            with self.subTest(op=op):
+                self.assertEqual(self.output(True, op), expected[op])
+        self.assertEqual(self.module.filter_columnar([]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()